@@ -0,0 +1,79 @@
+"""
+Локальная замена ISteamUser/GetPlayerSummaries для нагрузочных прогонов.
+
+Умеет: задержку ответа, долю ответов 429 и «текучку» присутствия —
+на каждом запросе каждый игрок с вероятностью churn заходит в BF6 или выходит.
+ResolveVanityURL знает имена вида bench<N> -> VANITY_ID_BASE + N.
+"""
+import asyncio
+import random
+from collections import Counter
+
+from aiohttp import web
+
+BF6_APPID = "2807960"
+VANITY_ID_BASE = 76561197960265728
+
+
+class FakeSteam:
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        error_rate: float = 0.0,
+        churn: float = 0.0,
+        seed: int = 1,
+    ) -> None:
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.churn = churn
+        self.rng = random.Random(seed)
+        self.playing: set[str] = set()
+        self.stats: Counter = Counter()
+
+    def _player(self, steam_id: str) -> dict:
+        if self.churn and self.rng.random() < self.churn:
+            self.playing ^= {steam_id}
+
+        data = {
+            "steamid": steam_id,
+            "personaname": f"player{steam_id[-5:]}",
+            "profileurl": f"https://steamcommunity.com/profiles/{steam_id}/",
+            "avatar": "https://avatars.steamstatic.com/0000000000000000000000000000000000000000.jpg",
+            "personastate": 1 if steam_id in self.playing else 0,
+            "lastlogoff": 1700000000,
+            "communityvisibilitystate": 3,
+        }
+        if steam_id in self.playing:
+            data["gameid"] = BF6_APPID
+            data["gameextrainfo"] = "Battlefield 6"
+        return data
+
+    async def summaries(self, request: web.Request) -> web.Response:
+        self.stats["calls"] += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.stats["429"] += 1
+            return web.Response(status=429, text="Too Many Requests", headers={"Retry-After": "1"})
+
+        ids = [s for s in request.query.get("steamids", "").split(",") if s]
+        self.stats["ids"] += len(ids)
+        players = [self._player(sid) for sid in ids]
+        return web.json_response({"response": {"players": players}})
+
+    async def resolve_vanity(self, request: web.Request) -> web.Response:
+        self.stats["vanity"] += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+        name = request.query.get("vanityurl", "")
+        if name.startswith("bench") and name[5:].isdigit():
+            return web.json_response({"response": {"steamid": str(VANITY_ID_BASE + int(name[5:])), "success": 1}})
+        return web.json_response({"response": {"success": 42, "message": "No match"}})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/ISteamUser/GetPlayerSummaries/v2/", self.summaries)
+        app.router.add_get("/ISteamUser/ResolveVanityURL/v1/", self.resolve_vanity)
+        return app
@@ -0,0 +1,63 @@
+"""
+Локальная замена Bot API (https://api.telegram.org/bot<token>/<method>).
+Отвечает успехом на всё, считает вызовы по методам; по желанию отдаёт 429.
+"""
+import asyncio
+import itertools
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+
+class FakeTelegram:
+    def __init__(self, latency_ms: float = 0.0, error_rate: float = 0.0, seed: int = 1) -> None:
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1000)
+
+    async def method(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.calls["429"] += 1
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": "Too Many Requests: retry after 1",
+                    "parameters": {"retry_after": 1},
+                }
+            )
+
+        data = await request.post()
+        if method == "getMe":
+            return web.json_response(
+                {"ok": True, "result": {"id": 42, "is_bot": True, "first_name": "bench", "username": "bench_bot"}}
+            )
+        if method == "getUpdates":
+            # long polling без апдейтов
+            await asyncio.sleep(min(float(data.get("timeout") or 0), 1.0))
+            return web.json_response({"ok": True, "result": []})
+        if method not in ("sendMessage", "editMessageText"):
+            return web.json_response({"ok": True, "result": True})
+
+        chat_id = int(data.get("chat_id") or 0)
+        result = {
+            "message_id": int(data.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "group" if chat_id < 0 else "private"},
+            "text": data.get("text", ""),
+        }
+        return web.json_response({"ok": True, "result": result})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.method)
+        return app
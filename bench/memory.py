@@ -0,0 +1,92 @@
+"""
+Память и нагрузка на GC от состояния поллера на большом ростере.
+
+    python -m bench.memory --chats 5000 --players 200000 --unique 50000
+
+Наполняет временную SQLite (как bench.run), поднимает StateStore и ростер
+Poller'а (load_roster) и печатает JSON: сколько байт заняло состояние
+(tracemalloc), сколько объектов под присмотром GC добавилось и сколько
+длится полный gc.collect() с ним.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bench.run import git_rev, peak_rss_mb, seed_db
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--chats", type=int, default=5000)
+    p.add_argument("--players", type=int, default=200000, help="строк в players (пар чат×игрок)")
+    p.add_argument("--unique", type=int, default=50000, help="уникальных steam_id")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--out", default="", help="куда записать JSON (по умолчанию stdout)")
+    return p.parse_args(argv)
+
+
+def _gc_collect_ms() -> float:
+    t0 = time.perf_counter()
+    gc.collect()
+    return (time.perf_counter() - t0) * 1000
+
+
+async def measure(args: argparse.Namespace) -> dict:
+    from bot.config import Config
+    from bot.games import GameIndex
+    from bot.panel import PanelTracker
+    from bot.poller import FeedSource, Poller
+    from bot.state import StateStore
+
+    cfg = Config(bot_token="42:bench", steam_api_key="bench", poll_interval=3600, bf6_appid="2807960")
+    gc.collect()
+    objects0 = len(gc.get_objects())
+    base_gc_ms = _gc_collect_ms()
+
+    tracemalloc.start()
+    store = StateStore()
+    await store.hydrate()
+    poller = Poller(None, cfg, FeedSource(cfg.ingest_interval), store, PanelTracker(cfg.panel_refresh), GameIndex(cfg.bf6_appid))
+    await poller.load_roster()
+    gc.collect()
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    pairs = sum(len(s) for s in store._states.values())
+    return {
+        "git_rev": git_rev(),
+        "params": {k: v for k, v in vars(args).items() if k != "out"},
+        "pairs": pairs,
+        "state_mb": round(used / 2**20, 2),
+        "bytes_per_pair": round(used / max(1, pairs), 1),
+        "gc_objects": len(gc.get_objects()) - objects0,
+        "gc_collect_ms": round(_gc_collect_ms() - base_gc_ms, 2),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bf6-bench-"), "bench.db")
+    # до импорта bot.db: движок создаётся при импорте
+    os.environ["DB_URL"] = f"sqlite+aiosqlite:///{db_path}"
+
+    asyncio.run(seed_db(args))
+    result = asyncio.run(measure(args))
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
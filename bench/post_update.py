@@ -0,0 +1,80 @@
+"""
+Шлёт заготовленный апдейт на вебхук бота (UPDATES_MODE=webhook) —
+локальная проверка без Telegram.
+
+    python -m bench.post_update --text "/liststeam" --chat-id -100123
+    python -m bench.post_update --file update.json --secret "$WEBHOOK_SECRET"
+
+Без --file собирается апдейт-сообщение с текстом --text. Чтобы ответы
+бота никуда не уходили, запустите его с TELEGRAM_API_BASE на fake
+Telegram из bench.fake_telegram.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import time
+
+import aiohttp
+
+_update_ids = itertools.count(int(time.time()))
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--url", default="http://127.0.0.1:8080/telegram/webhook")
+    p.add_argument("--secret", default="", help="WEBHOOK_SECRET бота")
+    p.add_argument("--file", default="", help="JSON с готовым апдейтом (или их списком)")
+    p.add_argument("--text", default="/liststeam")
+    p.add_argument("--chat-id", type=int, default=-1000001)
+    p.add_argument("--user-id", type=int, default=1)
+    p.add_argument("--count", type=int, default=1, help="сколько раз отправить")
+    return p.parse_args(argv)
+
+
+def message_update(text: str, chat_id: int, user_id: int) -> dict:
+    update_id = next(_update_ids)
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id % 1000000,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup" if chat_id < 0 else "private", "title": "bench"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+            "text": text,
+            "entities": (
+                [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+                if text.startswith("/")
+                else []
+            ),
+        },
+    }
+
+
+async def post(args: argparse.Namespace) -> int:
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            canned = json.load(f)
+        updates = canned if isinstance(canned, list) else [canned]
+    else:
+        updates = [message_update(args.text, args.chat_id, args.user_id) for _ in range(args.count)]
+
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    failed = 0
+    async with aiohttp.ClientSession() as session:
+        for update in updates:
+            t0 = time.perf_counter()
+            async with session.post(args.url, json=update, headers=headers) as resp:
+                ms = (time.perf_counter() - t0) * 1000
+                print(f"update {update.get('update_id')}: HTTP {resp.status} in {ms:.1f} ms")
+                failed += resp.status != 200
+    return failed
+
+
+def main(argv=None) -> None:
+    sys.exit(1 if asyncio.run(post(parse_args(argv))) else 0)
+
+
+if __name__ == "__main__":
+    main()
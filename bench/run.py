@@ -0,0 +1,262 @@
+"""
+Нагрузочный прогон поллера против локальных фейков Steam и Bot API.
+
+    python -m bench.run --chats 10000 --players 100000 --unique 20000 --ticks 5 --out bench.json
+
+Поднимает fake Steam и fake Telegram на localhost, наполняет отдельную
+SQLite-базу (или PostgreSQL из --db-url), гоняет фиксированное число тиков настоящего Poller/StateStore/
+Outbox и печатает JSON: перцентили длительности тика, вызовы Steam и
+Bot API, число SQL-запросов и пиковый RSS. По умолчанию каждый тик —
+полный проход по всем id (--adaptive включает обычное расписание).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from aiohttp import web
+
+from bench.fake_steam import FakeSteam
+from bench.fake_telegram import FakeTelegram
+
+STEAM_ID_BASE = 76561197960265728
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--chats", type=int, default=1000)
+    p.add_argument("--players", type=int, default=10000, help="строк в players (пар чат×игрок)")
+    p.add_argument("--unique", type=int, default=5000, help="уникальных steam_id")
+    p.add_argument("--ticks", type=int, default=5)
+    p.add_argument("--adaptive", action="store_true", help="адаптивное расписание вместо полного прохода")
+    p.add_argument("--steam-latency-ms", type=float, default=50.0)
+    p.add_argument("--steam-429-rate", type=float, default=0.0)
+    p.add_argument("--churn", type=float, default=0.05, help="вероятность смены статуса игрока за запрос")
+    p.add_argument("--steam-rps", type=float, default=0.0, help="0 — без лимита")
+    p.add_argument("--steam-concurrency", type=int, default=8)
+    p.add_argument("--steam-keys", type=int, default=1, help="сколько ключей в пуле (--steam-rps — на ключ)")
+    p.add_argument("--steam-retries", type=int, default=3)
+    p.add_argument("--tg-latency-ms", type=float, default=5.0)
+    p.add_argument("--tg-429-rate", type=float, default=0.0)
+    p.add_argument("--tg-rps", type=float, default=0.0, help="0 — без лимита")
+    p.add_argument("--drain-timeout", type=float, default=30.0)
+    p.add_argument("--db", default="", help="путь к SQLite (по умолчанию — временный файл)")
+    p.add_argument("--db-url", default="", help="DB_URL вместо SQLite, напр. postgresql+asyncpg://... (схема пересоздаётся!)")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--out", default="", help="куда записать JSON (по умолчанию stdout)")
+    return p.parse_args(argv)
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pct(p: float) -> float:
+        idx = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered) + 0.5) - 1))
+        return round(ordered[idx], 2)
+
+    return {"p50": pct(50), "p90": pct(90), "p99": pct(99), "max": round(ordered[-1], 2)}
+
+
+def git_rev() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return out.stdout.strip()
+    except Exception:
+        return ""
+
+
+def peak_rss_mb() -> float:
+    # Linux: ru_maxrss в КБ
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+async def seed_db(args: argparse.Namespace) -> None:
+    """
+    Заливка через Core executemany — работает и на SQLite, и на PostgreSQL.
+    """
+    from bot.db import engine
+    from bot.models import Base, Chat, Player
+
+    rng = random.Random(args.seed)
+    unique = [STEAM_ID_BASE + i for i in range(args.unique)]
+    per_chat = max(1, args.players // max(1, args.chats))
+
+    chats = [{"chat_id": -(1000000 + c), "panel_message_id": 1, "silent_alerts": 0} for c in range(args.chats)]
+    players = []
+    for c in range(args.chats):
+        for sid in rng.sample(unique, min(per_chat, len(unique))):
+            players.append({"chat_id": -(1000000 + c), "steam_id": sid, "display_name": None})
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(Chat.__table__.insert(), chats)
+        await conn.execute(Player.__table__.insert(), players)
+    # соединения пула привязаны к этому event loop
+    await engine.dispose()
+
+
+async def _serve(app: web.Application) -> tuple[web.AppRunner, str]:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def run(args: argparse.Namespace) -> dict:
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from sqlalchemy import event
+
+    from bot import metrics
+    from bot.config import Config
+    from bot.db import engine
+    from bot.games import GameIndex
+    from bot.outbox import Outbox
+    from bot.panel import PanelTracker
+    from bot.poller import Poller, SteamSource
+    from bot.state import StateStore
+    from bot.steam import SteamClient
+
+    fake_steam = FakeSteam(args.steam_latency_ms, args.steam_429_rate, args.churn, args.seed)
+    fake_tg = FakeTelegram(args.tg_latency_ms, args.tg_429_rate, args.seed)
+    steam_runner, steam_url = await _serve(fake_steam.app())
+    tg_runner, tg_url = await _serve(fake_tg.app())
+
+    queries = 0
+
+    def _count(*_):
+        nonlocal queries
+        queries += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", _count)
+
+    cfg = Config(
+        bot_token="42:bench",
+        steam_api_key=",".join(f"bench{i}" for i in range(max(1, args.steam_keys))),
+        poll_interval=3600,
+        bf6_appid="2807960",
+        steam_api_base=steam_url,
+        telegram_api_base=tg_url,
+        pipeline_fetch_workers=args.steam_concurrency,
+    )
+    steam = SteamClient(
+        cfg.steam_api_key,
+        concurrency=args.steam_concurrency,
+        rate_per_sec=args.steam_rps,
+        base_url=cfg.steam_api_base,
+        retries=args.steam_retries,
+        backoff_base=0.05,
+    )
+    bot = Bot(
+        token=cfg.bot_token,
+        session=AiohttpSession(api=TelegramAPIServer.from_base(cfg.telegram_api_base)),
+    )
+    outbox = Outbox(bot, global_rate=args.tg_rps, chat_rate=args.tg_rps, group_per_min=0, concurrency=32)
+    outbox_task = asyncio.create_task(outbox.run())
+
+    startup_t0 = time.perf_counter()
+    store = StateStore()
+    await store.hydrate()
+    hydrate_ms = (time.perf_counter() - startup_t0) * 1000
+
+    source = SteamSource(cfg, steam)
+    if not args.adaptive:
+        sch = source.scheduler
+        sch.online_sec = sch.ingame_sec = sch.offline_sec = sch.long_offline_sec = 0
+    poller = Poller(outbox, cfg, source, store, PanelTracker(cfg.panel_refresh), GameIndex(cfg.bf6_appid))
+
+    tick_ms: list[float] = []
+    tick_queries: list[int] = []
+    failed = 0
+    for _ in range(args.ticks):
+        q0 = queries
+        t0 = time.perf_counter()
+        try:
+            await poller.tick()
+            await store.flush()
+        except Exception:
+            failed += 1
+        tick_ms.append((time.perf_counter() - t0) * 1000)
+        tick_queries.append(queries - q0)
+
+    drain_t0 = time.perf_counter()
+    await outbox.drain(args.drain_timeout)
+    drain_ms = (time.perf_counter() - drain_t0) * 1000
+    await poller.save_pages()
+
+    outbox_task.cancel()
+    await asyncio.gather(outbox_task, return_exceptions=True)
+    await steam.close()
+    await bot.session.close()
+    await steam_runner.cleanup()
+    await tg_runner.cleanup()
+
+    return {
+        "git_rev": git_rev(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "db", "db_url")},
+        "db_dialect": engine.dialect.name,
+        "hydrate_ms": round(hydrate_ms, 2),
+        "tick_ms": percentiles(tick_ms),
+        "ticks": [round(t, 2) for t in tick_ms],
+        "failed_ticks": failed,
+        "steam": {
+            "calls": fake_steam.stats["calls"],
+            "ids": fake_steam.stats["ids"],
+            "429": fake_steam.stats["429"],
+            "retries": int(metrics.STEAM_RETRIES.get()),
+        },
+        "telegram": dict(fake_tg.calls),
+        "telegram_pending": outbox.pending(),
+        "telegram_drain_ms": round(drain_ms, 2),
+        "db_queries": {"total": queries, "per_tick": tick_queries},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+
+    if args.db_url:
+        db_url = args.db_url
+    else:
+        db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="bf6-bench-"), "bench.db")
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        db_url = f"sqlite+aiosqlite:///{db_path}"
+    # до импорта bot.db: движок создаётся при импорте
+    os.environ["DB_URL"] = db_url
+
+    t0 = time.perf_counter()
+    asyncio.run(seed_db(args))
+    seed_ms = (time.perf_counter() - t0) * 1000
+
+    result = asyncio.run(run(args))
+    result["seed_ms"] = round(seed_ms, 2)
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+ADMIN_STATUSES = ("administrator", "creator")
+
+
+class AdminCache:
+    """
+    Кэш админов чата: один get_chat_administrators на чат раз в ttl
+    вместо get_chat_member на каждую команду.
+
+    Параллельные запросы по одному чату схлопываются (single-flight),
+    а апдейты chat_member / my_chat_member сбрасывают запись чата.
+    """
+
+    def __init__(self, ttl: int = 600) -> None:
+        self.ttl = ttl
+        self._admins: dict[int, tuple[float, frozenset[int]]] = {}
+        self._inflight: dict[int, asyncio.Task] = {}
+        # растёт при invalidate: запрос, начатый раньше, свой ответ не кэширует
+        self._gen: dict[int, int] = {}
+
+    async def get_admins(self, bot, chat_id: int) -> frozenset[int]:
+        cached = self._admins.get(chat_id)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        task = self._inflight.get(chat_id)
+        if task is None:
+            # запрос — своей задачей: отмена одного вызывающего
+            # не отменяет его для остальных
+            task = asyncio.create_task(self._fetch(bot, chat_id, self._gen.get(chat_id, 0)))
+            task.add_done_callback(_retrieve)
+            self._inflight[chat_id] = task
+        return await asyncio.shield(task)
+
+    async def _fetch(self, bot, chat_id: int, gen: int) -> frozenset[int]:
+        try:
+            members = await bot.get_chat_administrators(chat_id=chat_id)
+            admins = frozenset(m.user.id for m in members if m.status in ADMIN_STATUSES)
+            if self._gen.get(chat_id, 0) == gen:
+                self._admins[chat_id] = (time.monotonic() + self.ttl, admins)
+            return admins
+        finally:
+            if self._inflight.get(chat_id) is asyncio.current_task():
+                del self._inflight[chat_id]
+
+    async def is_admin(self, bot, chat_id: int, user_id: int) -> bool:
+        return user_id in await self.get_admins(bot, chat_id)
+
+    def invalidate(self, chat_id: int) -> None:
+        self._admins.pop(chat_id, None)
+        self._gen[chat_id] = self._gen.get(chat_id, 0) + 1
+        # следующий вызов спросит Telegram заново, не дожидаясь старого запроса
+        self._inflight.pop(chat_id, None)
+
+
+def _retrieve(task: asyncio.Task) -> None:
+    # ошибку уже получили ожидающие; без них asyncio ругался бы в лог
+    if not task.cancelled():
+        task.exception()
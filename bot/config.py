@@ -1,4 +1,5 @@
 import os
+import socket
 from dataclasses import dataclass
 
 from dotenv import load_dotenv
@@ -10,26 +11,219 @@ class Config:
     steam_api_key: str
     poll_interval: int
     bf6_appid: str
+    poll_online_interval: int = 15
+    poll_offline_interval: int = 450
+    long_offline_after: int = 3 * 86400
+    steam_concurrency: int = 4
+    steam_rps: float = 5.0
+    steam_daily_limit: int = 100000
+    steam_retries: int = 3
+    steam_breaker_threshold: int = 5
+    steam_breaker_reset: float = 60.0
+    pipeline_fetch_workers: int = 4
+    pipeline_queue: int = 4
+    state_flush_interval: int = 30
+    panel_refresh: int = 300
+    panel_debounce: float = 2.0
+    panel_debounce_max: float = 10.0
+    tg_global_rps: float = 30.0
+    tg_chat_rps: float = 1.0
+    tg_group_per_min: float = 20.0
+    tg_send_concurrency: int = 8
+    poller_mode: str = "embedded"
+    poll_shards: int = 64
+    lease_ttl: int = 30
+    ingest_interval: float = 2.0
+    worker_id: str = ""
+    steam_api_base: str = "https://api.steampowered.com"
+    telegram_api_base: str = ""
+    web_host: str = "0.0.0.0"
+    web_port: int = 8080
+    admin_cache_ttl: int = 600
+    updates_mode: str = "polling"
+    webhook_url: str = ""
+    webhook_path: str = "/telegram/webhook"
+    webhook_secret: str = ""
+    snapshot_path: str = "./vol/poller-snapshot.json"
+    vanity_cache_ttl: int = 7 * 86400
+    import_max_rows: int = 500
+    events_history: int = 10000
+    events_buffer: int = 1000
+    events_token: str = ""
+    trace_path: str = ""
+    trace_slow_ms: float = 1000.0
+    trace_max_mb: float = 10.0
+    trace_backups: int = 3
+    profile_dir: str = "./vol/profiles"
+    profile_seconds: int = 30
+    profile_interval_ms: float = 5.0
+    profile_admins: tuple[int, ...] = ()
 
 
-def load_config() -> Config:
+def load_config(require_bot_token: bool = True) -> Config:
     load_dotenv()
 
     bot_token = os.getenv("BOT_TOKEN", "").strip()
-    if not bot_token:
+    # воркерам-поллерам (bot.worker) токен бота не нужен
+    if not bot_token and require_bot_token:
         raise RuntimeError("BOT_TOKEN is not set")
 
-    steam_api_key = os.getenv("STEAM_API_KEY", "").strip()
-    # Steam key для шага 1 не обязателен, но пусть будет в конфиге:
-    if not steam_api_key:
-        steam_api_key = ""
+    # один ключ или несколько через запятую (STEAM_API_KEYS) — пул с квотой на каждый
+    steam_api_key = os.getenv("STEAM_API_KEYS", "").strip() or os.getenv("STEAM_API_KEY", "").strip()
+    steam_api_key = ",".join(k.strip() for k in steam_api_key.split(",") if k.strip())
 
     poll_interval = int(os.getenv("POLL_INTERVAL", "45"))
     bf6_appid = os.getenv("BF6_APPID", "2807960").strip()
 
+    # адаптивный опрос: онлайн (не в BF6) — чаще, в BF6 и недавно офлайн —
+    # POLL_INTERVAL, давно офлайн (дольше LONG_OFFLINE_AFTER) — реже всех
+    poll_online_interval = int(os.getenv("POLL_ONLINE_INTERVAL", str(max(5, poll_interval // 3))))
+    poll_offline_interval = int(os.getenv("POLL_OFFLINE_INTERVAL", str(poll_interval * 10)))
+    long_offline_after = int(os.getenv("LONG_OFFLINE_AFTER", str(3 * 86400)))
+
+    # параллельные батчи к Steam и общий темп запросов на ключ
+    steam_concurrency = int(os.getenv("STEAM_CONCURRENCY", "4"))
+    steam_rps = float(os.getenv("STEAM_RPS", "5"))
+    # дневной лимит вызовов на ключ (0 — без учёта), повторы неудачного батча
+    # и circuit breaker: после N неудачных батчей подряд пауза на RESET секунд
+    steam_daily_limit = int(os.getenv("STEAM_DAILY_LIMIT", "100000"))
+    steam_retries = int(os.getenv("STEAM_RETRIES", "3"))
+    steam_breaker_threshold = int(os.getenv("STEAM_BREAKER_THRESHOLD", "5"))
+    steam_breaker_reset = float(os.getenv("STEAM_BREAKER_RESET", "60"))
+
+    # конвейер тика: сколько батчей Steam грузится одновременно и сколько
+    # готовых батчей может ждать расчёта переходов (дальше загрузка ждёт)
+    pipeline_fetch_workers = int(os.getenv("PIPELINE_FETCH_WORKERS", str(steam_concurrency)))
+    pipeline_queue = int(os.getenv("PIPELINE_QUEUE", "4"))
+
+    # как часто сбрасывать изменённые состояния из памяти в БД
+    state_flush_interval = int(os.getenv("STATE_FLUSH_INTERVAL", "30"))
+
+    # каденция обновления времени в панели (длительности, «Upd:»), сек
+    panel_refresh = int(os.getenv("PANEL_REFRESH", "300"))
+    # после команд, меняющих ростер, панель перерисовывается, когда команды
+    # стихнут на PANEL_DEBOUNCE сек (но не позже PANEL_DEBOUNCE_MAX от первой)
+    panel_debounce = float(os.getenv("PANEL_DEBOUNCE", "2"))
+    panel_debounce_max = float(os.getenv("PANEL_DEBOUNCE_MAX", "10"))
+
+    # лимиты исходящих сообщений Bot API
+    tg_global_rps = float(os.getenv("TG_GLOBAL_RPS", "30"))
+    tg_chat_rps = float(os.getenv("TG_CHAT_RPS", "1"))
+    tg_group_per_min = float(os.getenv("TG_GROUP_PER_MIN", "20"))
+    tg_send_concurrency = int(os.getenv("TG_SEND_CONCURRENCY", "8"))
+
+    # embedded — бот сам опрашивает Steam;
+    # external — опрашивают воркеры (python -m bot.worker), бот читает их наблюдения
+    poller_mode = os.getenv("POLLER_MODE", "embedded").strip().lower()
+    if poller_mode not in ("embedded", "external"):
+        raise RuntimeError(f"Unknown POLLER_MODE: {poller_mode}")
+    poll_shards = int(os.getenv("POLL_SHARDS", "64"))
+    lease_ttl = int(os.getenv("LEASE_TTL", "30"))
+    ingest_interval = float(os.getenv("INGEST_INTERVAL", "2"))
+    worker_id = os.getenv("WORKER_ID", "").strip() or f"{socket.gethostname()}-{os.getpid()}"
+
+    # подмена API (локальный Bot API сервер, фейки из bench/)
+    steam_api_base = os.getenv("STEAM_API_BASE", "https://api.steampowered.com").strip()
+    telegram_api_base = os.getenv("TELEGRAM_API_BASE", "").strip()
+
+    # встроенный HTTP-сервер (/metrics); WEB_PORT=0 — выключен
+    web_host = os.getenv("WEB_HOST", "0.0.0.0").strip()
+    web_port = int(os.getenv("WEB_PORT", "8080"))
+
+    # сколько жить кэшу админов чата (сбрасывается и по chat_member апдейтам)
+    admin_cache_ttl = int(os.getenv("ADMIN_CACHE_TTL", "600"))
+
+    # polling — getUpdates; webhook — апдейты приходят POST'ом на встроенный HTTP-сервер
+    updates_mode = os.getenv("UPDATES_MODE", "polling").strip().lower()
+    if updates_mode not in ("polling", "webhook"):
+        raise RuntimeError(f"Unknown UPDATES_MODE: {updates_mode}")
+    # публичный https-адрес без пути; пусто — вебхук не регистрируем (локальная отладка)
+    webhook_url = os.getenv("WEBHOOK_URL", "").strip().rstrip("/")
+    webhook_path = "/" + os.getenv("WEBHOOK_PATH", "/telegram/webhook").strip().lstrip("/")
+    webhook_secret = os.getenv("WEBHOOK_SECRET", "").strip()
+    if updates_mode == "webhook" and not web_port:
+        raise RuntimeError("UPDATES_MODE=webhook needs WEB_PORT")
+    # вебхук, зарегистрированный снаружи, без общего секрета принимал бы любой POST
+    if updates_mode == "webhook" and not webhook_url and not webhook_secret:
+        raise RuntimeError("UPDATES_MODE=webhook without WEBHOOK_URL needs WEBHOOK_SECRET")
+
+    # снапшот поллера для тёплого старта; пусто — выключен
+    snapshot_path = os.getenv("SNAPSHOT_PATH", "./vol/poller-snapshot.json").strip()
+
+    # /importsteam: сколько помнить ResolveVanityURL и сколько строк за раз
+    vanity_cache_ttl = int(os.getenv("VANITY_CACHE_TTL", str(7 * 86400)))
+    import_max_rows = int(os.getenv("IMPORT_MAX_ROWS", "500"))
+
+    # SSE-лента переходов (/events на WEB_PORT): сколько событий держать для
+    # продолжения по Last-Event-ID (0 — ленты нет), буфер на подписчика и токен;
+    # без EVENTS_TOKEN ленты нет: в ней chat_id, steam_id и ники всех чатов
+    events_history = int(os.getenv("EVENTS_HISTORY", "10000"))
+    events_buffer = int(os.getenv("EVENTS_BUFFER", "1000"))
+    events_token = os.getenv("EVENTS_TOKEN", "").strip()
+
+    # трассировка: спаны дольше TRACE_SLOW_MS и спаны с ошибкой — в ротируемый
+    # JSONL (TRACE_PATH пуст — выключено)
+    trace_path = os.getenv("TRACE_PATH", "").strip()
+    trace_slow_ms = float(os.getenv("TRACE_SLOW_MS", "1000"))
+    trace_max_mb = float(os.getenv("TRACE_MAX_MB", "10"))
+    trace_backups = int(os.getenv("TRACE_BACKUPS", "3"))
+
+    # профиль event loop по /profile (только PROFILE_ADMINS — user id через запятую) или SIGUSR1
+    profile_dir = os.getenv("PROFILE_DIR", "./vol/profiles").strip()
+    profile_seconds = int(os.getenv("PROFILE_SECONDS", "30"))
+    profile_interval_ms = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+    profile_admins = tuple(int(x) for x in os.getenv("PROFILE_ADMINS", "").split(",") if x.strip())
+
     return Config(
         bot_token=bot_token,
         steam_api_key=steam_api_key,
         poll_interval=poll_interval,
         bf6_appid=bf6_appid,
+        poll_online_interval=poll_online_interval,
+        poll_offline_interval=poll_offline_interval,
+        long_offline_after=long_offline_after,
+        steam_concurrency=steam_concurrency,
+        steam_rps=steam_rps,
+        steam_daily_limit=steam_daily_limit,
+        steam_retries=steam_retries,
+        steam_breaker_threshold=steam_breaker_threshold,
+        steam_breaker_reset=steam_breaker_reset,
+        pipeline_fetch_workers=pipeline_fetch_workers,
+        pipeline_queue=pipeline_queue,
+        state_flush_interval=state_flush_interval,
+        panel_refresh=panel_refresh,
+        panel_debounce=panel_debounce,
+        panel_debounce_max=panel_debounce_max,
+        tg_global_rps=tg_global_rps,
+        tg_chat_rps=tg_chat_rps,
+        tg_group_per_min=tg_group_per_min,
+        tg_send_concurrency=tg_send_concurrency,
+        poller_mode=poller_mode,
+        poll_shards=poll_shards,
+        lease_ttl=lease_ttl,
+        ingest_interval=ingest_interval,
+        worker_id=worker_id,
+        steam_api_base=steam_api_base,
+        telegram_api_base=telegram_api_base,
+        web_host=web_host,
+        web_port=web_port,
+        admin_cache_ttl=admin_cache_ttl,
+        updates_mode=updates_mode,
+        webhook_url=webhook_url,
+        webhook_path=webhook_path,
+        webhook_secret=webhook_secret,
+        snapshot_path=snapshot_path,
+        vanity_cache_ttl=vanity_cache_ttl,
+        import_max_rows=import_max_rows,
+        events_history=events_history,
+        events_buffer=events_buffer,
+        events_token=events_token,
+        trace_path=trace_path,
+        trace_slow_ms=trace_slow_ms,
+        trace_max_mb=trace_max_mb,
+        trace_backups=trace_backups,
+        profile_dir=profile_dir,
+        profile_seconds=profile_seconds,
+        profile_interval_ms=profile_interval_ms,
+        profile_admins=profile_admins,
     )
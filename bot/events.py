@@ -0,0 +1,202 @@
+"""
+Лента переходов присутствия для внешних потребителей (дашборды, другие боты).
+
+StateStore публикует каждый старт/стоп сессии в EventBus в памяти процесса,
+а HTTP-сервер отдаёт ленту как Server-Sent Events (GET /events). У каждого
+события — возрастающий seq (он же SSE id): переподключившийся клиент
+присылает Last-Event-ID и получает пропущенное из кольцевой истории.
+Читать player_states из БД в цикле больше незачем.
+
+Лента включается только вместе с EVENTS_TOKEN (Bearer или ?token=):
+в ней chat_id, steam_id и ники всех чатов, а HTTP-сервер в режиме
+вебхука смотрит в интернет.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import time
+from collections import deque
+from typing import Iterable, Optional
+
+from aiohttp import web
+
+from bot import metrics
+
+logger = logging.getLogger(__name__)
+
+# комментарий-пинг, чтобы прокси не закрывали молчащее соединение
+KEEPALIVE_SEC = 15.0
+# подсказка клиенту EventSource, через сколько мс переподключаться
+RETRY_MS = 1000
+
+
+class Subscription:
+    """
+    Ограниченный буфер одного подписчика. Не успел разобрать — буфер
+    переполнился: подписка закрывается (lagged), а клиент продолжает
+    с Last-Event-ID, пока пропущенное ещё в истории шины.
+    """
+
+    def __init__(self, chat_ids: Optional[set[int]], maxsize: int) -> None:
+        self.chat_ids = chat_ids
+        self.queue: asyncio.Queue[bytes] = asyncio.Queue(maxsize=max(1, maxsize))
+        self.lagged = False
+
+    def wants(self, chat_id: int) -> bool:
+        return self.chat_ids is None or chat_id in self.chat_ids
+
+    async def get(self) -> Optional[bytes]:
+        """
+        Следующий кадр; None — подписка закрыта из-за отставания.
+        """
+        if self.lagged and self.queue.empty():
+            return None
+        return await self.queue.get()
+
+    def get_nowait(self) -> Optional[bytes]:
+        try:
+            return self.queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return None
+
+
+class EventBus:
+    """
+    Pub/sub в памяти: publish синхронный и дешёвый (одна сериализация
+    на событие, put_nowait в буферы подписчиков), история — deque
+    последних history кадров для продолжения с seq.
+    """
+
+    def __init__(self, history: int = 10000, buffer: int = 1000) -> None:
+        # seq начинается с текущего времени в мс: после рестарта номера
+        # не повторяются, а Last-Event-ID из прошлого процесса — просто «старый»
+        self._seq = int(time.time() * 1000)
+        self._history: deque[tuple[int, int, bytes]] = deque(maxlen=max(1, history))
+        self._subs: set[Subscription] = set()
+        self.buffer = buffer
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subs)
+
+    def publish(self, chat_id: int, event: dict) -> int:
+        self._seq += 1
+        seq = self._seq
+        payload = json.dumps({"seq": seq, **event}, ensure_ascii=False, separators=(",", ":"))
+        frame = f"id: {seq}\nevent: presence\ndata: {payload}\n\n".encode("utf-8")
+        self._history.append((seq, chat_id, frame))
+        metrics.EVENTS_PUBLISHED.inc()
+
+        for sub in list(self._subs):
+            if not sub.wants(chat_id):
+                continue
+            try:
+                sub.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                sub.lagged = True
+                self._subs.discard(sub)
+                metrics.EVENTS_LAGGED.inc()
+        return seq
+
+    def subscribe(
+        self,
+        since: Optional[int] = None,
+        chat_ids: Optional[Iterable[int]] = None,
+    ) -> tuple[Subscription, list[bytes], bool]:
+        """
+        Подписка + кадры истории после since. Третий элемент — gap: часть
+        событий после since уже вытеснена из истории (клиенту стоит
+        перечитать состояние целиком).
+        """
+        sub = Subscription(set(chat_ids) if chat_ids is not None else None, self.buffer)
+        backlog: list[bytes] = []
+        gap = False
+        if since is not None:
+            oldest = self._history[0][0] if self._history else self._seq + 1
+            gap = since < oldest - 1 or since > self._seq
+            backlog = [frame for seq, chat_id, frame in self._history if seq > since and sub.wants(chat_id)]
+        # между снимком истории и регистрацией нет await — ничего не теряется
+        self._subs.add(sub)
+        return sub, backlog, gap
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        self._subs.discard(sub)
+
+
+# -------------------------
+# SSE
+# -------------------------
+EVENTS_BUS = web.AppKey("events_bus", EventBus)
+EVENTS_TOKEN = web.AppKey("events_token", str)
+
+
+def _authorized(request: web.Request, token: str) -> bool:
+    # пустой токен — ленту не отдаём никому
+    if not token:
+        return False
+    header = request.headers.get("Authorization", "")
+    given = header[7:] if header.startswith("Bearer ") else request.query.get("token", "")
+    return hmac.compare_digest(given.encode(), token.encode())
+
+
+def _parse_ids(raw: str) -> Optional[list[int]]:
+    if not raw:
+        return None
+    return [int(x) for x in raw.split(",") if x.strip()]
+
+
+async def events_handler(request: web.Request) -> web.StreamResponse:
+    """
+    GET /events[?chat_id=1,2][&since=<seq>] — SSE-лента переходов.
+    Продолжение — заголовком Last-Event-ID (его шлёт EventSource) или ?since=.
+    """
+    if not _authorized(request, request.app[EVENTS_TOKEN]):
+        raise web.HTTPUnauthorized()
+    try:
+        chat_ids = _parse_ids(request.query.get("chat_id", ""))
+        since_raw = request.headers.get("Last-Event-ID") or request.query.get("since", "")
+        since = int(since_raw) if since_raw else None
+    except ValueError:
+        raise web.HTTPBadRequest(text="chat_id and since must be integers")
+
+    bus = request.app[EVENTS_BUS]
+    sub, backlog, gap = bus.subscribe(since, chat_ids)
+    resp = web.StreamResponse(
+        headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
+    try:
+        await resp.prepare(request)
+        head = f"retry: {RETRY_MS}\n\n"
+        if gap:
+            # пропущенное уже не в истории: текущий seq, дальше — живая лента
+            head += f"event: reset\ndata: {json.dumps({'seq': bus.seq})}\n\n"
+        await resp.write(head.encode() + b"".join(backlog))
+
+        while True:
+            try:
+                frame = await asyncio.wait_for(sub.get(), KEEPALIVE_SEC)
+            except asyncio.TimeoutError:
+                await resp.write(b": ping\n\n")
+                continue
+            if frame is None:
+                logger.info("Events subscriber dropped: buffer of %d overflowed", bus.buffer)
+                break
+            # всё, что уже накопилось, — одной записью
+            frames = [frame]
+            while (more := sub.get_nowait()) is not None:
+                frames.append(more)
+            await resp.write(b"".join(frames))
+    except ConnectionResetError:
+        pass
+    finally:
+        bus.unsubscribe(sub)
+    return resp
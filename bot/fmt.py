@@ -0,0 +1,14 @@
+"""
+Форматирование для сообщений бота (панель, статистика).
+"""
+
+
+def fmt_duration(seconds: int) -> str:
+    """
+    Длительность до минут: «1h05m», «42m».
+    """
+    m = max(0, seconds) // 60
+    h = m // 60
+    if h > 0:
+        return f"{h}h{m % 60:02d}m"
+    return f"{m}m"
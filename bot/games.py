@@ -0,0 +1,94 @@
+"""
+Какие игры отслеживает каждый чат.
+
+Чат без строк в chat_games смотрит игру по умолчанию (BF6_APPID).
+Обратный индекс appid -> чаты позволяет одним summary игрока обслужить
+все игры: проверка «смотрит ли чат эту игру» — поиск в множестве.
+"""
+from typing import Iterable, Optional
+
+DEFAULT_TITLE = "Battlefield 6"
+
+_NOBODY: frozenset[int] = frozenset()
+
+
+class GameIndex:
+    def __init__(self, default_appid: str) -> None:
+        self.default_appid = str(default_appid)
+        self.default_games = {self.default_appid: DEFAULT_TITLE}
+        # только чаты с явным списком; остальные смотрят default_games
+        self._chat_games: dict[int, dict[str, str]] = {}
+        # appid -> чаты, включая чаты по умолчанию
+        self._app_chats: dict[str, set[int]] = {}
+        # все проиндексированные чаты
+        self._chats: set[int] = set()
+        # чаты, у которых поменялся список игр (их игроков надо пересчитать)
+        self._changed: set[int] = set()
+
+    def load(self, chat_games: dict[int, dict[str, str]], chat_ids: Iterable[int]) -> None:
+        """
+        Пересобирает индекс: chat_games из БД + все известные чаты.
+        """
+        old = self._chat_games
+        self._chat_games = {c: dict(g) for c, g in chat_games.items() if g}
+        self._app_chats = {}
+        self._chats = set(chat_ids) | set(self._chat_games)
+        for chat_id in self._chats:
+            self._index(chat_id)
+            if old.get(chat_id) != self._chat_games.get(chat_id):
+                self._changed.add(chat_id)
+
+    def add_chat(self, chat_id: int) -> None:
+        """
+        Чат, появившийся после load() (первый /addsteam): без строк
+        в chat_games он смотрит игру по умолчанию.
+        """
+        if chat_id not in self._chats:
+            self._chats.add(chat_id)
+            self._index(chat_id)
+
+    def _index(self, chat_id: int) -> None:
+        for appid in self.games(chat_id):
+            self._app_chats.setdefault(appid, set()).add(chat_id)
+
+    def set_chat(self, chat_id: int, games: dict[str, str]) -> None:
+        """
+        Список игр одного чата поменяли командой — не ждём перечитки из БД.
+        Пустой список — обратно к игре по умолчанию.
+        """
+        for chats in self._app_chats.values():
+            chats.discard(chat_id)
+        if games:
+            self._chat_games[chat_id] = dict(games)
+        else:
+            self._chat_games.pop(chat_id, None)
+        self._chats.add(chat_id)
+        self._index(chat_id)
+        self._changed.add(chat_id)
+
+    def games(self, chat_id: int) -> dict[str, str]:
+        """
+        appid -> название игры для чата.
+        """
+        return self._chat_games.get(chat_id) or self.default_games
+
+    def watching(self, appid: Optional[str]) -> set[int] | frozenset[int]:
+        """
+        Чаты, которые смотрят appid.
+        """
+        if not appid:
+            return _NOBODY
+        return self._app_chats.get(appid, _NOBODY)
+
+    def appids(self) -> set[str]:
+        """
+        Все отслеживаемые appid (для расписания опроса).
+        """
+        return {appid for appid, chats in self._app_chats.items() if chats} or {self.default_appid}
+
+    def title(self, chat_id: int, appid: Optional[str]) -> str:
+        return self.games(chat_id).get(appid or "") or f"App {appid}"
+
+    def take_changed(self) -> set[int]:
+        changed, self._changed = self._changed, set()
+        return changed
@@ -1,33 +1,46 @@
 import re
+import time
 from typing import Optional
 
 from aiogram import Router
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
-from aiogram.types import Message
+from aiogram.types import ChatMemberUpdated, Message
 
+from bot import trace
+from bot.admins import AdminCache
 from bot.db import session_scope
-from bot.panel import render_panel
+from bot.games import GameIndex
+from bot.panel import PanelRefresher, PanelTracker, empty_page
+from bot.profiler import Profiler, top_frames
 from bot.repo import (
+    add_chat_game,
     add_player,
-    get_panel_message_id,
-    get_states_map,
+    get_chat_games,
+    get_panel_pages,
+    get_play_stats,
     list_players,
-    set_panel_message_id,
+    remove_chat_game,
+    set_panel_pages,
     upsert_chat,
 )
+from bot.roster_import import STEAM_ID_RE, RosterImporter, render_report
+from bot.state import StateStore
+from bot.stats import day_key, live_seconds, parse_period, period_start, render_stats
 
 router = Router()
-STEAM_ID_RE = re.compile(r"^\d{17}$")
+# больше в одном файле импорта не ждём: ~500 строк с именами — десятки КБ
+IMPORT_MAX_BYTES = 256 * 1024
+APPID_RE = re.compile(r"^\d{1,10}$")
 
 
 # -------------------------------------------------
 # Helpers
 # -------------------------------------------------
-async def _is_admin(message: Message) -> bool:
+async def _is_admin(message: Message, admins: AdminCache) -> bool:
     """
     Возвращает True, если пользователь админ/создатель чата.
-    В private-чате всегда True.
+    В private-чате всегда True. Список админов берётся из кэша.
     """
     if not message.chat or not message.from_user:
         return False
@@ -36,11 +49,7 @@ async def _is_admin(message: Message) -> bool:
         return True
 
     try:
-        member = await message.bot.get_chat_member(
-            chat_id=message.chat.id,
-            user_id=message.from_user.id,
-        )
-        return member.status in ("administrator", "creator")
+        return await admins.is_admin(message.bot, message.chat.id, message.from_user.id)
     except TelegramBadRequest:
         return False
 
@@ -62,8 +71,8 @@ def _parse_addsteam_args(text: str) -> tuple[Optional[str], Optional[str]]:
 # Commands
 # -------------------------------------------------
 @router.message(Command("addsteam"))
-async def cmd_addsteam(message: Message) -> None:
-    if not await _is_admin(message):
+async def cmd_addsteam(message: Message, admins: AdminCache, refresher: PanelRefresher) -> None:
+    if not await _is_admin(message, admins):
         await _deny(message)
         return
 
@@ -78,12 +87,50 @@ async def cmd_addsteam(message: Message) -> None:
 
     async with session_scope() as session:
         await upsert_chat(session, message.chat.id)
-        await add_player(session, message.chat.id, steam_id, name)
+        await add_player(session, message.chat.id, int(steam_id), name)
         await session.commit()
+    refresher.mark(message.chat.id)
 
     await message.answer("✅ Игрок добавлен / обновлён.")
 
 
+@router.message(Command("importsteam"))
+async def cmd_importsteam(
+    message: Message,
+    admins: AdminCache,
+    importer: RosterImporter,
+    refresher: PanelRefresher,
+) -> None:
+    if not await _is_admin(message, admins):
+        await _deny(message)
+        return
+
+    # список — в тексте команды (по строке на игрока) или файлом:
+    # с подписью /importsteam либо ответом /importsteam на сообщение с файлом
+    parts = (message.text or message.caption or "").split(maxsplit=1)
+    text = parts[1] if len(parts) > 1 else ""
+    document = message.document or (message.reply_to_message.document if message.reply_to_message else None)
+    if document is not None:
+        if (document.file_size or 0) > IMPORT_MAX_BYTES:
+            await message.answer(f"Файл больше {IMPORT_MAX_BYTES // 1024} КБ.")
+            return
+        data = await message.bot.download(document)
+        text += "\n" + data.read().decode("utf-8-sig", errors="replace")
+
+    if not text.strip():
+        await message.answer(
+            "Использование: `/importsteam`, а дальше по строке на игрока:\n"
+            "`<steam_id | ссылка на профиль | имя профиля> [имя]`\n"
+            "Можно приложить .txt/.csv с подписью /importsteam.",
+            parse_mode="Markdown",
+        )
+        return
+
+    rows = await importer.run(message.chat.id, text)
+    refresher.mark(message.chat.id)
+    await message.answer(render_report(rows))
+
+
 @router.message(Command("liststeam"))
 async def cmd_liststeam(message: Message) -> None:
     async with session_scope() as session:
@@ -103,50 +150,195 @@ async def cmd_liststeam(message: Message) -> None:
     await message.answer("\n".join(lines), parse_mode="Markdown")
 
 
-@router.message(Command("panel"))
-async def cmd_panel(message: Message) -> None:
-    if not await _is_admin(message):
-        await _deny(message)
+@router.message(Command("games"))
+async def cmd_games(
+    message: Message,
+    admins: AdminCache,
+    games: GameIndex,
+    refresher: PanelRefresher,
+) -> None:
+    parts = (message.text or "").split(maxsplit=3)
+    action = parts[1].lower() if len(parts) > 1 else ""
+    chat_id = message.chat.id
+
+    if action not in ("", "add", "remove"):
+        await message.answer(
+            "Использование:\n`/games` — список\n`/games add <appid> [название]`\n`/games remove <appid>`",
+            parse_mode="Markdown",
+        )
         return
 
+    if action:
+        if not await _is_admin(message, admins):
+            await _deny(message)
+            return
+        appid = parts[2].strip() if len(parts) > 2 else ""
+        if not APPID_RE.match(appid):
+            await message.answer("Укажите appid игры из Steam (число из ссылки store.steampowered.com/app/<appid>).")
+            return
+
+        async with session_scope() as session:
+            await upsert_chat(session, chat_id)
+            if action == "add":
+                title = parts[3].strip()[:128] if len(parts) > 3 else f"App {appid}"
+                current = await get_chat_games(session, chat_id)
+                if not current and appid != games.default_appid:
+                    # первая явная игра — игру по умолчанию сохраняем в списке
+                    await add_chat_game(session, chat_id, games.default_appid, games.default_games[games.default_appid])
+                await add_chat_game(session, chat_id, appid, title)
+            elif not await remove_chat_game(session, chat_id, appid):
+                await session.rollback()
+                await message.answer("Этой игры нет в списке чата.")
+                return
+            current = await get_chat_games(session, chat_id)
+            await session.commit()
+        # индекс поллера — сразу, без ожидания перечитки ростера
+        games.set_chat(chat_id, current)
+        refresher.mark(chat_id)
+
+    lines = ["🎮 **Игры чата:**"]
+    for appid, title in games.games(chat_id).items():
+        lines.append(f"• {title} — `{appid}`")
+    await message.answer("\n".join(lines), parse_mode="Markdown")
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message, store: StateStore, games: GameIndex) -> None:
+    parts = (message.text or "").split(maxsplit=1)
+    days = parse_period(parts[1] if len(parts) > 1 else None)
+    if days is None:
+        await message.answer(
+            "Использование:\n`/stats [today|week|month|all|<N>d]`",
+            parse_mode="Markdown",
+        )
+        return
+
+    now = int(time.time())
+    start_ts = period_start(days, now)
+
+    # только роллапы: время ответа не растёт с историей
     async with session_scope() as session:
-        await upsert_chat(session, message.chat.id)
         players = await list_players(session, message.chat.id)
-        states = await get_states_map(session, message.chat.id)
-        panel_id = await get_panel_message_id(session, message.chat.id)
+        rows = await get_play_stats(session, message.chat.id, day_key(start_ts) if start_ts else 0)
         await session.commit()
 
-    text = render_panel(players, states)
-
-    # Если панель существует — редактируем
-    if panel_id:
-        try:
-            await message.bot.edit_message_text(
-                chat_id=message.chat.id,
-                message_id=panel_id,
-                text=text,
-            )
-            await message.answer("✅ Панель обновлена.")
-            return
-        except TelegramBadRequest:
-            panel_id = None
+    names = dict(players)
+    live = live_seconds(store.chat_states(message.chat.id), start_ts, now)
+    await message.answer(render_stats(days, rows, names, live, games.games(message.chat.id)))
 
-    # Иначе создаём новую
-    msg = await message.answer(text, disable_notification=True)
 
-    # Пытаемся закрепить
-    try:
-        await message.bot.pin_chat_message(
-            chat_id=message.chat.id,
-            message_id=msg.message_id,
-            disable_notification=True,
-        )
-    except TelegramBadRequest:
-        pass
+@router.message(Command("panel"))
+async def cmd_panel(
+    message: Message,
+    store: StateStore,
+    panels: PanelTracker,
+    admins: AdminCache,
+    games: GameIndex,
+) -> None:
+    if not await _is_admin(message, admins):
+        await _deny(message)
+        return
 
+    chat_id = message.chat.id
     async with session_scope() as session:
-        await upsert_chat(session, message.chat.id)
-        await set_panel_message_id(session, message.chat.id, msg.message_id)
+        await upsert_chat(session, chat_id)
+        players = await list_players(session, chat_id)
+        page_ids = await get_panel_pages(session, chat_id)
         await session.commit()
 
-    await message.answer("📌 Панель создана (и закреплена, если у бота есть права).")
+    chat_games = games.games(chat_id)
+    pages = panels.render(chat_id, players, store.chat_states(chat_id), panels.now(), chat_games)
+    # лишние старые страницы очищаем, а не удаляем
+    pages += [empty_page(chat_games)] * (len(page_ids) - len(pages))
+
+    created = 0
+    new_ids: list[int] = []
+    for page, text in enumerate(pages):
+        # Если страница существует — редактируем
+        if page < len(page_ids):
+            with trace.span("cmd_panel_edit", chat_id=chat_id, page=page) as sp:
+                try:
+                    await message.bot.edit_message_text(
+                        chat_id=chat_id,
+                        message_id=page_ids[page],
+                        text=text,
+                    )
+                    edited = True
+                except TelegramBadRequest as e:
+                    edited = "message is not modified" in str(e)
+                    if not edited:
+                        # сообщение удалили или его нельзя править — создадим заново
+                        sp.fail(e)
+            if edited:
+                new_ids.append(page_ids[page])
+                panels.remember(chat_id, text, page)
+                continue
+
+        # Иначе создаём новую
+        msg = await message.answer(text, disable_notification=True)
+        new_ids.append(msg.message_id)
+        panels.remember(chat_id, text, page)
+        created += 1
+
+        # Пытаемся закрепить
+        with trace.span("cmd_panel_pin", chat_id=chat_id, page=page) as sp:
+            try:
+                await message.bot.pin_chat_message(
+                    chat_id=chat_id,
+                    message_id=msg.message_id,
+                    disable_notification=True,
+                )
+            except TelegramBadRequest as e:
+                sp.fail(e)
+
+    if new_ids != page_ids:
+        async with session_scope() as session:
+            await upsert_chat(session, chat_id)
+            await set_panel_pages(session, chat_id, new_ids)
+            await session.commit()
+    panels.set_pages(chat_id, new_ids)
+
+    if created:
+        await message.answer("📌 Панель создана (и закреплена, если у бота есть права).")
+    else:
+        await message.answer("✅ Панель обновлена.")
+
+
+@router.message(Command("profile"))
+async def cmd_profile(message: Message, profiler: Profiler) -> None:
+    # профилирует процесс бота целиком — только операторам из PROFILE_ADMINS
+    if not message.from_user or message.from_user.id not in profiler.admins:
+        await message.answer("⛔ Эта команда доступна только операторам бота.")
+        return
+
+    parts = (message.text or "").split(maxsplit=1)
+    arg = parts[1].strip() if len(parts) > 1 else ""
+    if arg and not arg.isdigit():
+        await message.answer("Использование:\n`/profile [секунд]`", parse_mode="Markdown")
+        return
+    if profiler.running:
+        await message.answer("Профиль уже снимается.")
+        return
+
+    seconds = int(arg) if arg else None
+    await message.answer(f"⏱ Снимаю профиль event loop: {seconds or profiler.default_seconds} с…")
+    result = await profiler.run(seconds)
+    if result is None:
+        await message.answer("Профиль уже снимается.")
+        return
+
+    path, stacks = result
+    lines = [f"📈 Профиль: {path}", f"Сэмплов: {sum(stacks.values())}", ""]
+    for frame, count in top_frames(stacks):
+        lines.append(f"{count} — {frame}")
+    await message.answer("\n".join(lines)[:3900])
+
+
+# -------------------------------------------------
+# Membership updates
+# -------------------------------------------------
+@router.chat_member()
+@router.my_chat_member()
+async def on_member_update(event: ChatMemberUpdated, admins: AdminCache) -> None:
+    # сменились права/состав — список админов чата перечитаем при следующей команде
+    admins.invalidate(event.chat.id)
@@ -1,14 +1,30 @@
 import asyncio
 import logging
+import secrets
+import signal
 
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import CommandStart
 from aiogram.types import Message
 
+from bot import metrics, trace
+from bot.admins import AdminCache
 from bot.config import load_config
+from bot.events import EventBus
+from bot.games import GameIndex
 from bot.handlers import router
 from bot.migrate import init_models
-from bot.poller import poll_loop
+from bot.outbox import Outbox
+from bot.panel import PanelRefresher, PanelTracker
+from bot.poller import FeedSource, Poller, SteamSource
+from bot.profiler import Profiler
+from bot.roster_import import RosterImporter
+from bot.snapshot import load_snapshot, save_snapshot
+from bot.state import StateStore, flush_loop
+from bot.steam import SteamClient
+from bot.web import add_webhook, build_app, start_web
 
 
 
@@ -17,11 +33,44 @@ async def on_start(message: Message) -> None:
         "👋 Я бот алертов Battlefield 6 (Steam).\n\n"
         "Команды:\n"
         "• /addsteam <steam_id> [имя]\n"
+        "• /importsteam — список SteamID, ссылок или имён профилей\n"
         "• /liststeam\n"
         "• /panel\n"
+        "• /stats [today|week|month|all]\n"
+        "• /games [add <appid> [название] | remove <appid>]\n"
     )
 
 
+async def serve_webhook(dp: Dispatcher, bot: Bot, url: str, secret: str, **data) -> None:
+    """
+    Режим вебхука: регистрирует URL у Telegram и ждёт SIGINT/SIGTERM.
+    Сами апдейты принимает HTTP-сервер (bot.web.add_webhook).
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await dp.emit_startup(bot=bot, **dp.workflow_data, **data)
+    if url:
+        await bot.set_webhook(
+            url,
+            secret_token=secret,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logging.info("Webhook set: %s", url)
+    else:
+        logging.warning("WEBHOOK_URL is empty - webhook is not registered, serving local POSTs only")
+
+    try:
+        await stop.wait()
+    finally:
+        if url:
+            await bot.delete_webhook()
+            logging.info("Webhook deleted")
+        await dp.emit_shutdown(bot=bot, **dp.workflow_data, **data)
+
+
 async def main() -> None:
     logging.basicConfig(
         level=logging.INFO,
@@ -29,17 +78,125 @@ async def main() -> None:
     )
 
     cfg = load_config()
+    trace.configure(cfg.trace_path, cfg.trace_slow_ms, cfg.trace_max_mb, cfg.trace_backups)
     await init_models()
+    metrics.mark_startup("init_models")
 
-    bot = Bot(token=cfg.bot_token)
+    # лента переходов нужна только тем, кто её читает с HTTP-сервера,
+    # и без токена не отдаётся никому
+    bus = None
+    if cfg.events_history > 0 and cfg.web_port and cfg.events_token:
+        bus = EventBus(cfg.events_history, cfg.events_buffer)
+    store = StateStore(bus)
+    await store.hydrate()
+    metrics.mark_startup("hydrate")
+    panels = PanelTracker(cfg.panel_refresh)
+    refresher = PanelRefresher(cfg.panel_debounce, cfg.panel_debounce_max)
+    games = GameIndex(cfg.bf6_appid)
+    admins = AdminCache(cfg.admin_cache_ttl)
+
+    session = None
+    if cfg.telegram_api_base:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(cfg.telegram_api_base))
+    bot = Bot(token=cfg.bot_token, session=session)
+    bot.session.middleware(metrics.TelegramMetricsMiddleware())
     dp = Dispatcher()
 
     dp.message.register(on_start, CommandStart())
     dp.include_router(router)
 
-    logging.info("Bot starting...")
-    asyncio.create_task(poll_loop(bot, cfg))
-    await dp.start_polling(bot)
+    steam = SteamClient(
+        cfg.steam_api_key,
+        concurrency=cfg.steam_concurrency,
+        rate_per_sec=cfg.steam_rps,
+        base_url=cfg.steam_api_base,
+        daily_limit=cfg.steam_daily_limit,
+        retries=cfg.steam_retries,
+        breaker_threshold=cfg.steam_breaker_threshold,
+        breaker_reset=cfg.steam_breaker_reset,
+    )
+
+    outbox = Outbox(
+        bot,
+        global_rate=cfg.tg_global_rps,
+        chat_rate=cfg.tg_chat_rps,
+        group_per_min=cfg.tg_group_per_min,
+        concurrency=cfg.tg_send_concurrency,
+    )
+
+    if cfg.poller_mode == "external":
+        # Steam опрашивают воркеры, сюда приходят их наблюдения
+        source = FeedSource(cfg.ingest_interval)
+        await source.hydrate()
+    else:
+        source = SteamSource(cfg, steam)
+    await load_snapshot(cfg.snapshot_path, source, panels)
+    metrics.mark_startup("snapshot")
+
+    metrics.OUTBOX_PENDING.set_function(outbox.pending)
+    metrics.STATE_DIRTY.set_function(lambda: store.dirty_count)
+    if bus is not None:
+        metrics.EVENTS_SUBSCRIBERS.set_function(lambda: bus.subscribers)
+    metrics.STEAM_BUDGET_LEFT.set_function(steam.keys.budget_left)
+    metrics.STEAM_POLL_PACE.set_function(steam.keys.pace)
+    metrics.STEAM_BREAKER_OPEN.set_function(lambda: 1 if steam.breaker.is_open else 0)
+
+    importer = RosterImporter(steam, cfg.vanity_cache_ttl, cfg.import_max_rows)
+    profiler = Profiler(cfg.profile_dir, cfg.profile_seconds, cfg.profile_interval_ms, cfg.profile_admins)
+    # kill -USR1 <pid> — профиль в фоне, путь к файлу — в лог
+    asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, profiler.start_background)
+    deps = {
+        "store": store,
+        "panels": panels,
+        "admins": admins,
+        "importer": importer,
+        "games": games,
+        "profiler": profiler,
+        "refresher": refresher,
+    }
+
+    app = build_app(bus, cfg.events_token)
+    webhook_url = webhook_secret = ""
+    if cfg.updates_mode == "webhook":
+        webhook_url = (cfg.webhook_url + cfg.webhook_path) if cfg.webhook_url else ""
+        # без явного WEBHOOK_SECRET — случайный на каждый запуск
+        # (для нескольких реплик за балансировщиком задайте его явно)
+        webhook_secret = cfg.webhook_secret or secrets.token_urlsafe(32)
+        add_webhook(app, dp, bot, cfg.webhook_path, webhook_secret, **deps)
+
+    web_runner = None
+    if cfg.web_port:
+        web_runner = await start_web(app, cfg.web_host, cfg.web_port)
+
+    logging.info("Bot starting (%.2fs after start)...", metrics.mark_startup("ready"))
+    outbox_task = asyncio.create_task(outbox.run())
+    tasks = [asyncio.create_task(flush_loop(store, cfg.state_flush_interval))]
+    poller = Poller(outbox, cfg, source, store, panels, games)
+    if cfg.poller_mode == "embedded" and not cfg.steam_api_key:
+        logging.warning("STEAM_API_KEY is empty - polling will not work!")
+    else:
+        tasks.append(asyncio.create_task(poller.run()))
+    tasks.append(asyncio.create_task(refresher.run(poller.refresh_chats)))
+    try:
+        if cfg.updates_mode == "webhook":
+            await serve_webhook(dp, bot, webhook_url, webhook_secret, **deps)
+        else:
+            await dp.start_polling(bot, **deps)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # дослать то, что уже в очереди
+        await outbox.drain()
+        outbox_task.cancel()
+        await asyncio.gather(outbox_task, return_exceptions=True)
+        await steam.close()
+        if web_runner is not None:
+            await web_runner.cleanup()
+        # последние изменения состояний и созданные страницы панелей — в БД
+        await store.flush()
+        await poller.save_pages()
+        await save_snapshot(cfg.snapshot_path, source, panels)
 
 
 if __name__ == "__main__":
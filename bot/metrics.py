@@ -0,0 +1,237 @@
+"""
+Минимальные метрики в формате Prometheus (text exposition 0.0.4).
+
+Своя маленькая реализация вместо prometheus_client: на горячем пути —
+только инкремент/bisect по словарю, гейджи с колбэками считаются
+лишь в момент скрейпа.
+"""
+import bisect
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_REGISTRY: list["_Metric"] = []
+
+# отсчёт времени старта — от загрузки модулей бота
+_STARTED_AT = time.monotonic()
+
+
+def _fmt_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        _REGISTRY.append(self)
+
+    def _key(self, labels: tuple[str, ...]) -> tuple[str, ...]:
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name}: expected labels {self.labels}, got {labels}")
+        return tuple(str(v) for v in labels)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = ()) -> None:
+        super().__init__(name, doc, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_value(v)}"
+            for k, v in sorted(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = ()) -> None:
+        super().__init__(name, doc, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._fn: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def set_function(self, fn: Callable[[], float]) -> None:
+        """
+        Значение считается только при скрейпе (для гейджа без меток).
+        """
+        self._fn = fn
+
+    def samples(self) -> list[str]:
+        if self._fn is not None:
+            return [f"{self.name} {_fmt_value(self._fn())}"]
+        return [
+            f"{self.name}{_fmt_labels(self.labels, k)} {_fmt_value(v)}"
+            for k, v in sorted(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        doc: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [счётчики по бакетам..., +Inf], сумма
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            self._sums[key] = 0.0
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[key] += value
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *labels)
+
+    def samples(self) -> list[str]:
+        out: list[str] = []
+        for key in sorted(self._counts):
+            counts = self._counts[key]
+            acc = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                acc += n
+                le = f'le="{_fmt_value(bound)}"'
+                out.append(f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.labels, key)} {_fmt_value(self._sums[key])}")
+            out.append(f"{self.name}_count{_fmt_labels(self.labels, key)} {acc}")
+        return out
+
+
+def render() -> str:
+    lines: list[str] = []
+    for metric in _REGISTRY:
+        lines.extend(metric.header())
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+# -------------------------
+# Метрики бота
+# -------------------------
+POLL_TICK_SECONDS = Histogram("bf6_poll_tick_seconds", "Full poll tick duration")
+POLL_STAGE_SECONDS = Histogram(
+    "bf6_poll_stage_seconds",
+    "Poll tick stage duration",
+    labels=("stage",),
+)
+POLL_ERRORS = Counter("bf6_poll_errors_total", "Poll ticks that raised")
+
+STEAM_BATCH_SECONDS = Histogram("bf6_steam_batch_seconds", "GetPlayerSummaries request latency")
+STEAM_ERRORS = Counter("bf6_steam_errors_total", "Steam request errors", labels=("kind",))
+STEAM_IDS_FETCHED = Counter("bf6_steam_ids_fetched_total", "Steam IDs requested from GetPlayerSummaries")
+STEAM_BATCHES_UNCHANGED = Counter(
+    "bf6_steam_batches_unchanged_total",
+    "Steam batches with no player record changed since the previous poll (diff skipped)",
+)
+STEAM_RETRIES = Counter("bf6_steam_retries_total", "Steam batch retries after a retryable error")
+STEAM_KEY_CALLS = Counter("bf6_steam_key_calls_total", "Steam API calls per key (key fingerprint)", labels=("key",))
+STEAM_BUDGET_LEFT = Gauge("bf6_steam_budget_left_ratio", "Share of today's Steam API call budget left (all keys)")
+STEAM_POLL_PACE = Gauge("bf6_steam_poll_pace", "Poll interval stretch factor applied to save the daily budget")
+STEAM_BREAKER_OPEN = Gauge("bf6_steam_breaker_open", "1 while the Steam circuit breaker is open")
+
+TELEGRAM_CALLS = Counter("bf6_telegram_calls_total", "Bot API calls", labels=("method",))
+TELEGRAM_RETRY_AFTER = Counter("bf6_telegram_429_total", "Bot API 429 responses", labels=("method",))
+TELEGRAM_SECONDS = Histogram("bf6_telegram_request_seconds", "Bot API call latency", labels=("method",))
+
+EVENTS_PUBLISHED = Counter("bf6_events_published_total", "Presence transitions published to the change feed")
+EVENTS_LAGGED = Counter("bf6_events_lagged_total", "Change feed subscribers dropped after overflowing their buffer")
+EVENTS_SUBSCRIBERS = Gauge("bf6_events_subscribers", "Connected change feed subscribers")
+
+STATE_FLUSH_ROWS = Counter("bf6_state_flush_rows_total", "Player state rows written to the DB")
+
+OUTBOX_PENDING = Gauge("bf6_outbox_pending", "Jobs waiting in the Telegram outbox")
+STATE_DIRTY = Gauge("bf6_state_dirty", "Player states not yet flushed to the DB")
+TRACKED_CHATS = Gauge("bf6_tracked_chats", "Chats known to the poller")
+TRACKED_PLAYERS = Gauge("bf6_tracked_players", "Unique Steam IDs tracked by the poller")
+TRACKED_PAIRS = Gauge("bf6_tracked_pairs", "Chat x player pairs tracked by the poller")
+
+STARTUP_SECONDS = Gauge(
+    "bf6_startup_seconds",
+    "Seconds from process start to the end of each startup phase",
+    labels=("phase",),
+)
+
+
+def mark_startup(phase: str) -> float:
+    """
+    Фиксирует окончание фазы старта; возвращает секунды от запуска.
+    """
+    elapsed = time.monotonic() - _STARTED_AT
+    STARTUP_SECONDS.set(elapsed, phase)
+    return elapsed
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Request-middleware сессии aiogram: считает все вызовы Bot API
+    (и из outbox, и из хендлеров) по методам, их латентность и 429.
+    """
+
+    async def __call__(self, make_request, bot, method):
+        name = getattr(method, "__api_method__", type(method).__name__)
+        TELEGRAM_CALLS.inc(name)
+        t0 = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            TELEGRAM_RETRY_AFTER.inc(name)
+            raise
+        finally:
+            TELEGRAM_SECONDS.observe(time.perf_counter() - t0, name)
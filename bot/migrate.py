@@ -1,7 +1,87 @@
+import logging
+
+from sqlalchemy import Integer, inspect, text
+
 from bot.db import engine
-from bot.models import Base
+from bot.models import Base, SchemaVersion
+
+logger = logging.getLogger(__name__)
+
+# поднимать при любом изменении схемы (новая таблица, колонка, индекс)
+SCHEMA_VERSION = 6
+
+# колонки, добавленные в уже существующие таблицы: create_all их не создаст
+ADDED_COLUMNS = (
+    ("chats", "panel_page_ids", "VARCHAR(1024)"),
+    ("player_states", "appid", "VARCHAR(16)"),
+    ("play_sessions", "appid", "VARCHAR(16)"),
+)
+
+# таблицы, где steam_id был VARCHAR(32) и стал BIGINT
+STEAM_ID_TABLES = ("players", "player_states", "presence_updates", "play_sessions", "play_stats_daily")
+
+
+def _add_missing_columns(conn) -> None:
+    insp = inspect(conn)
+    for table, column, ddl in ADDED_COLUMNS:
+        existing = {c["name"] for c in insp.get_columns(table)}
+        if column not in existing:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def _convert_steam_ids(conn) -> None:
+    """
+    steam_id VARCHAR -> BIGINT. PostgreSQL меняет тип на месте; SQLite так
+    не умеет — таблица пересоздаётся по модели и данные копируются с CAST.
+    """
+    insp = inspect(conn)
+    for table in STEAM_ID_TABLES:
+        if not insp.has_table(table):
+            continue
+        column = next(c for c in insp.get_columns(table) if c["name"] == "steam_id")
+        if isinstance(column["type"], Integer):
+            continue
+
+        logger.info("Converting %s.steam_id to BIGINT", table)
+        if conn.dialect.name == "postgresql":
+            conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN steam_id TYPE BIGINT USING steam_id::bigint"))
+            continue
+
+        # имена индексов в SQLite глобальные — старые убираем до create()
+        for index in insp.get_indexes(table):
+            conn.execute(text(f'DROP INDEX IF EXISTS "{index["name"]}"'))
+        columns = [c["name"] for c in insp.get_columns(table)]
+        names = ", ".join(columns)
+        values = ", ".join("CAST(steam_id AS INTEGER)" if c == "steam_id" else c for c in columns)
+        conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}__old"))
+        Base.metadata.tables[table].create(conn)
+        conn.execute(text(f"INSERT INTO {table} ({names}) SELECT {values} FROM {table}__old"))
+        conn.execute(text(f"DROP TABLE {table}__old"))
+
+
+async def _current_version() -> int:
+    try:
+        async with engine.connect() as conn:
+            return (await conn.execute(text("SELECT max(version) FROM schema_version"))).scalar() or 0
+    except Exception:
+        # таблицы ещё нет — база старая или пустая
+        return 0
 
 
 async def init_models() -> None:
+    """
+    Обычный старт — один SELECT версии схемы. Полная проверка
+    (create_all с рефлексией + недостающие колонки) — только если
+    версия в БД отстаёт от SCHEMA_VERSION.
+    """
+    current = await _current_version()
+    if current >= SCHEMA_VERSION:
+        return
+
+    logger.info("Upgrading DB schema %d -> %d", current, SCHEMA_VERSION)
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_convert_steam_ids)
+        await conn.execute(SchemaVersion.__table__.delete())
+        await conn.execute(SchemaVersion.__table__.insert().values(version=SCHEMA_VERSION))
@@ -1,6 +1,6 @@
 from typing import Optional
 
-from sqlalchemy import Integer, String, UniqueConstraint
+from sqlalchemy import BigInteger, Integer, String, UniqueConstraint
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
@@ -8,33 +8,157 @@ class Base(DeclarativeBase):
     pass
 
 
+class SchemaVersion(Base):
+    """
+    Версия схемы (см. bot/migrate.py): на старте проверяется одним SELECT.
+    """
+
+    __tablename__ = "schema_version"
+
+    version: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+
 class Chat(Base):
     __tablename__ = "chats"
 
-    chat_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)  # -100… у супергрупп не влезает в int4
     panel_message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # страницы панели 2..N через запятую (первая — panel_message_id)
+    panel_page_ids: Mapped[Optional[str]] = mapped_column(String(1024), nullable=True)
     silent_alerts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
 
 
+class ChatGame(Base):
+    """
+    Игры, которые смотрит чат. Нет строк — только игра по умолчанию (BF6_APPID).
+    """
+
+    __tablename__ = "chat_games"
+
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    appid: Mapped[str] = mapped_column(String(16), primary_key=True)
+    title: Mapped[str] = mapped_column(String(128), nullable=False)
+
+
 class Player(Base):
     __tablename__ = "players"
     __table_args__ = (UniqueConstraint("chat_id", "steam_id", name="uq_chat_player"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    chat_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
-    steam_id: Mapped[str] = mapped_column(String(32), nullable=False, index=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False, index=True)
+    steam_id: Mapped[int] = mapped_column(BigInteger, nullable=False, index=True)  # SteamID64 числом, не строкой
     display_name: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
 
-from sqlalchemy import BigInteger
 
 class PlayerState(Base):
     __tablename__ = "player_states"
     __table_args__ = (UniqueConstraint("chat_id", "steam_id", name="uq_chat_state"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    chat_id: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
-    steam_id: Mapped[str] = mapped_column(String(32), nullable=False, index=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False, index=True)
+    steam_id: Mapped[int] = mapped_column(BigInteger, nullable=False, index=True)
 
     was_playing_bf6: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
     since_ts: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)       # unix ts
     last_alert_ts: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True) # unix ts
+    appid: Mapped[Optional[str]] = mapped_column(String(16), nullable=True)        # игра текущей/последней сессии
+
+
+class ShardLease(Base):
+    """
+    Аренда шарда steam_id воркером-поллером (см. bot/shards.py).
+    """
+
+    __tablename__ = "shard_leases"
+
+    shard: Mapped[int] = mapped_column(Integer, primary_key=True)
+    owner: Mapped[str] = mapped_column(String(128), nullable=False)
+    expires_ts: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+
+class PollerWorker(Base):
+    """
+    Heartbeat воркера-поллера: по живым воркерам считается справедливая доля шардов.
+    """
+
+    __tablename__ = "poller_workers"
+
+    owner: Mapped[str] = mapped_column(String(128), primary_key=True)
+    expires_ts: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+
+class PresenceUpdate(Base):
+    """
+    Наблюдения воркеров, ещё не обработанные процессом бота.
+    """
+
+    __tablename__ = "presence_updates"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    steam_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    gameid: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    personaname: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    personastate: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    lastlogoff: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    observed_ts: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
+class PresenceLatest(Base):
+    """
+    Последнее обработанное наблюдение по каждому steam_id (presence_updates
+    после чтения удаляются). Воркер пишет только изменения, поэтому после
+    рестарта бот поднимает отсюда то, что иначе узнал бы лишь при следующей смене.
+    """
+
+    __tablename__ = "presence_latest"
+
+    steam_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    gameid: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    personaname: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    personastate: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    lastlogoff: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    observed_ts: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
+class PlaySession(Base):
+    """
+    Завершённая игровая сессия (append-only): пишется на переходе «играл -> не играет».
+    """
+
+    __tablename__ = "play_sessions"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    steam_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    started_ts: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    ended_ts: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    appid: Mapped[Optional[str]] = mapped_column(String(16), nullable=True)
+
+
+class PlayStatDaily(Base):
+    """
+    Дневной роллап play_sessions по игроку чата; обновляется инкрементально.
+    day — YYYYMMDD по локальному времени начала сессии.
+    """
+
+    __tablename__ = "play_stats_daily"
+
+    chat_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    day: Mapped[int] = mapped_column(Integer, primary_key=True)
+    steam_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    total_sec: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    sessions: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    longest_sec: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+
+class VanityCache(Base):
+    """
+    Кэш ResolveVanityURL: имя профиля -> SteamID64 (NULL — профиля нет).
+    Свежесть — по resolved_ts (VANITY_CACHE_TTL).
+    """
+
+    __tablename__ = "vanity_cache"
+
+    vanity: Mapped[str] = mapped_column(String(64), primary_key=True)  # в нижнем регистре
+    steam_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    resolved_ts: Mapped[int] = mapped_column(BigInteger, nullable=False)
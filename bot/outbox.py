@@ -0,0 +1,363 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from bot import trace
+from bot.games import DEFAULT_TITLE
+from bot.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+PRIO_ALERT = 0
+PRIO_PANEL = 1
+
+MAX_ATTEMPTS = 3
+
+
+def _format_game(game: str, names: list[str]) -> str:
+    if len(names) == 1:
+        return f"🎮 **{names[0]}** запустил **{game}**!"
+    joined = ", ".join(f"**{n}**" for n in names)
+    return f"🎮 Запустили **{game}**: {joined}"
+
+
+def format_alert(items: list[tuple[str, str]]) -> str:
+    """
+    items: [(имя, игра), ...] -> одно сообщение, по строке на игру.
+    """
+    by_game: dict[str, list[str]] = {}
+    for name, game in items:
+        by_game.setdefault(game, []).append(name)
+    return "\n".join(_format_game(game, names) for game, names in by_game.items())
+
+
+@dataclass
+class _PanelEdit:
+    message_id: Optional[int]  # None — страницы ещё нет, отправить новым сообщением
+    text: str
+    on_sent: Optional[Callable[[int], None]] = None
+    on_gone: Optional[Callable[[], None]] = None  # бота убрали из чата — панели больше нет
+
+
+@dataclass
+class _ChatOutbox:
+    alerts: list[tuple[str, str]] = field(default_factory=list)  # (имя, игра)
+    alert_attempts: int = 0
+    panels: dict[int, _PanelEdit] = field(default_factory=dict)  # страница -> правка
+    blocked_until: float = 0.0
+    bucket: TokenBucket = field(default_factory=lambda: TokenBucket(1.0))
+    group_bucket: Optional[TokenBucket] = None
+
+
+class Outbox:
+    """
+    Единая точка отправки в Telegram.
+
+    Поллер только кладёт задания (алерты, правки панели) и не ждёт сети.
+    Диспетчер разбирает очередь по приоритету (алерты раньше панелей),
+    соблюдая глобальный лимит Bot API и лимиты на каждый чат,
+    склеивает несколько алертов одного чата в одно сообщение
+    и переживает 429, откладывая чат на retry_after.
+    """
+
+    def __init__(
+        self,
+        bot,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        group_per_min: float = 20.0,
+        concurrency: int = 8,
+    ) -> None:
+        self.bot = bot
+        self._global = TokenBucket(global_rate)
+        self._chat_rate = chat_rate
+        self._group_per_min = group_per_min
+        self._sem = asyncio.Semaphore(max(1, concurrency))
+
+        self._chats: dict[int, _ChatOutbox] = {}
+        self._queued: set[tuple[int, int]] = set()
+        self._in_flight: set[int] = set()
+        self._ready: list[tuple[int, int, int]] = []  # (prio, seq, chat_id)
+        self._delayed: list[tuple[float, int, int, int]] = []  # (ready_at, prio, seq, chat_id)
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._tasks: set[asyncio.Task] = set()
+
+    # -------------------------
+    # Producer API
+    # -------------------------
+    def alert(self, chat_id: int, display: str, game: str = DEFAULT_TITLE) -> None:
+        self._chat(chat_id).alerts.append((display, game))
+        self._push(chat_id, PRIO_ALERT)
+
+    def edit_panel(
+        self,
+        chat_id: int,
+        message_id: Optional[int],
+        text: str,
+        on_sent: Optional[Callable[[int], None]] = None,
+        page: int = 0,
+        on_gone: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """
+        Правка страницы панели; message_id=None — создать страницу
+        (новое сообщение, закрепляется). on_sent получает message_id;
+        on_gone вызывается, если писать в чат больше нельзя.
+        """
+        # более свежая версия страницы просто заменяет ещё не отправленную
+        self._chat(chat_id).panels[page] = _PanelEdit(message_id, text, on_sent, on_gone)
+        self._push(chat_id, PRIO_PANEL)
+
+    def pending(self) -> int:
+        return len(self._queued)
+
+    # -------------------------
+    # Internals
+    # -------------------------
+    def _chat(self, chat_id: int) -> _ChatOutbox:
+        ch = self._chats.get(chat_id)
+        if ch is None:
+            ch = _ChatOutbox(bucket=TokenBucket(self._chat_rate))
+            # группы (отрицательный chat_id): ещё и ~20 сообщений в минуту
+            if chat_id < 0 and self._group_per_min > 0:
+                ch.group_bucket = TokenBucket(self._group_per_min / 60.0, self._group_per_min)
+            self._chats[chat_id] = ch
+        return ch
+
+    def _push(self, chat_id: int, prio: int, delay: float = 0.0) -> None:
+        key = (chat_id, prio)
+        if delay <= 0 and key in self._queued:
+            return
+        self._queued.add(key)
+        if delay > 0:
+            heapq.heappush(self._delayed, (time.monotonic() + delay, prio, next(self._seq), chat_id))
+        else:
+            heapq.heappush(self._ready, (prio, next(self._seq), chat_id))
+        self._wakeup.set()
+
+    def _promote_delayed(self) -> Optional[float]:
+        """
+        Переносит созревшие отложенные задания в ready.
+        Возвращает через сколько секунд созреет следующее (или None).
+        """
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, prio, seq, chat_id = heapq.heappop(self._delayed)
+            heapq.heappush(self._ready, (prio, seq, chat_id))
+        if self._delayed:
+            return self._delayed[0][0] - now
+        return None
+
+    def _chat_delay(self, chat_id: int, ch: _ChatOutbox) -> float:
+        if chat_id in self._in_flight:
+            return 0.05
+        wait = max(0.0, ch.blocked_until - time.monotonic())
+        wait = max(wait, ch.bucket.delay())
+        if ch.group_bucket is not None:
+            wait = max(wait, ch.group_bucket.delay())
+        return wait
+
+    async def run(self) -> None:
+        while True:
+            next_delayed = self._promote_delayed()
+
+            if not self._ready:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=next_delayed)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            prio, seq, chat_id = heapq.heappop(self._ready)
+            ch = self._chat(chat_id)
+
+            # содержимое уже ушло с более ранней копией задания
+            if (prio == PRIO_ALERT and not ch.alerts) or (prio == PRIO_PANEL and not ch.panels):
+                self._queued.discard((chat_id, prio))
+                continue
+
+            wait = self._chat_delay(chat_id, ch)
+            if wait > 0:
+                # этот чат пока нельзя — не блокируем остальные
+                heapq.heappush(self._delayed, (time.monotonic() + wait, prio, seq, chat_id))
+                continue
+
+            wait = self._global.consume()
+            if wait > 0:
+                heapq.heappush(self._ready, (prio, seq, chat_id))
+                await asyncio.sleep(wait)
+                continue
+
+            ch.bucket.consume()
+            if ch.group_bucket is not None:
+                ch.group_bucket.consume()
+
+            self._queued.discard((chat_id, prio))
+            await self._sem.acquire()
+            self._in_flight.add(chat_id)
+            task = asyncio.create_task(self._send(chat_id, ch, prio))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, chat_id: int, ch: _ChatOutbox, prio: int) -> None:
+        try:
+            if prio == PRIO_ALERT:
+                await self._send_alerts(chat_id, ch)
+            else:
+                await self._send_panel(chat_id, ch)
+        finally:
+            self._in_flight.discard(chat_id)
+            self._sem.release()
+
+    async def _send_alerts(self, chat_id: int, ch: _ChatOutbox) -> None:
+        names, ch.alerts = ch.alerts, []
+        if not names:
+            return
+        with trace.span("tg_alert", chat_id=chat_id, names=len(names)) as sp:
+            await self._send_alert_message(chat_id, ch, names, sp)
+
+    async def _send_alert_message(self, chat_id: int, ch: _ChatOutbox, names: list, sp: trace.Span) -> None:
+        try:
+            await self.bot.send_message(chat_id, format_alert(names), parse_mode="Markdown")
+            ch.alert_attempts = 0
+        except TelegramRetryAfter as e:
+            sp.fail(e, "retry_after")
+            ch.alerts[:0] = names
+            ch.blocked_until = time.monotonic() + e.retry_after
+            self._push(chat_id, PRIO_ALERT, delay=e.retry_after)
+        except TelegramForbiddenError as e:
+            # бота удалили или заблокировали — повторять бесполезно
+            sp.fail(e)
+            ch.alert_attempts = 0
+            logger.warning("Dropping alert for chat %s: %s", chat_id, e.message)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            sp.fail(e)
+            ch.alert_attempts += 1
+            if ch.alert_attempts < MAX_ATTEMPTS:
+                ch.alerts[:0] = names
+                self._push(chat_id, PRIO_ALERT, delay=2.0 ** ch.alert_attempts)
+            else:
+                ch.alert_attempts = 0
+                logger.warning("Dropping alert for chat %s after %d attempts", chat_id, MAX_ATTEMPTS)
+        except Exception as e:
+            sp.fail(e)
+            logger.exception("Failed to send alert to chat %s", chat_id)
+
+    async def _send_panel(self, chat_id: int, ch: _ChatOutbox) -> None:
+        # по одной странице за вызов: каждая — отдельный запрос под лимитами.
+        # Порядок — как ставили в очередь (замена версии место не меняет),
+        # чтобы часто меняющаяся первая страница не держала остальные.
+        page = next(iter(ch.panels))
+        edit = ch.panels.pop(page)
+        if ch.panels:
+            self._push(chat_id, PRIO_PANEL)
+
+        with trace.span("tg_panel", chat_id=chat_id, page=page, create=edit.message_id is None) as sp:
+            message_id = await self._send_page(chat_id, ch, page, edit, sp)
+        if message_id is None:
+            return
+
+        # пока страница создавалась, в очередь могла встать её новая версия —
+        # это уже правка созданного сообщения, а не ещё одно сообщение
+        queued = ch.panels.get(page)
+        if queued is not None and queued.message_id is None:
+            queued.message_id = message_id
+
+        if edit.on_sent is not None:
+            edit.on_sent(message_id)
+
+    async def _send_page(
+        self,
+        chat_id: int,
+        ch: _ChatOutbox,
+        page: int,
+        edit: _PanelEdit,
+        sp: trace.Span,
+    ) -> Optional[int]:
+        """
+        Создаёт или правит одну страницу; message_id или None — не доставлено.
+        """
+        message_id = edit.message_id
+        try:
+            if message_id is None:
+                message_id = await self._create_page(chat_id, edit.text)
+            else:
+                await self.bot.edit_message_text(
+                    chat_id=chat_id,
+                    message_id=message_id,
+                    text=edit.text,
+                )
+        except TelegramRetryAfter as e:
+            sp.fail(e, "retry_after")
+            ch.panels.setdefault(page, edit)
+            ch.blocked_until = time.monotonic() + e.retry_after
+            self._push(chat_id, PRIO_PANEL, delay=e.retry_after)
+            return None
+        except TelegramForbiddenError as e:
+            # бота удалили из чата: панель снимаем, иначе правка повторялась бы вечно
+            sp.fail(e)
+            logger.warning("Dropping panel of chat %s: %s", chat_id, e.message)
+            ch.panels.clear()
+            if edit.on_gone is not None:
+                edit.on_gone()
+            return None
+        except TelegramBadRequest as e:
+            if "message to edit not found" in str(e):
+                # страницу удалили руками — создаём её заново на том же месте
+                sp.fail(e, "not_found")
+                logger.warning("Panel page %d of chat %s is gone, re-creating it", page, chat_id)
+                queued = ch.panels.setdefault(page, edit)
+                queued.message_id = None
+                self._push(chat_id, PRIO_PANEL)
+                return None
+            # текст уже такой же — считаем доставленным
+            if "message is not modified" not in str(e):
+                sp.fail(e)
+                logger.debug("Panel edit failed for chat %s: %s", chat_id, e)
+                return None
+            sp.set(not_modified=True)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            # не запоминаем отпечаток — поллер переотправит на следующем тике
+            sp.fail(e)
+            return None
+        except Exception as e:
+            sp.fail(e)
+            logger.exception("Failed to edit panel in chat %s", chat_id)
+            return None
+        return message_id
+
+    async def _create_page(self, chat_id: int, text: str) -> int:
+        msg = await self.bot.send_message(chat_id, text, disable_notification=True)
+        # страница уже есть — неудачное закрепление не повод её потерять
+        with trace.span("tg_pin", chat_id=chat_id) as sp:
+            try:
+                await self.bot.pin_chat_message(
+                    chat_id=chat_id,
+                    message_id=msg.message_id,
+                    disable_notification=True,
+                )
+            except Exception as e:
+                sp.fail(e)
+                logger.debug("Failed to pin panel page in chat %s: %s", chat_id, e)
+        return msg.message_id
+
+    async def drain(self, timeout: float = 5.0) -> None:
+        """
+        Даёт очереди дослать остатки при остановке.
+        """
+        deadline = time.monotonic() + timeout
+        while (self._queued or self._tasks) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
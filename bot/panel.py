@@ -1,67 +1,295 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import logging
+import time
 from datetime import datetime
-from typing import Optional
+from typing import Awaitable, Callable, Optional
 
+from bot.fmt import fmt_duration
+from bot.games import DEFAULT_TITLE
 
-def _fmt_duration(seconds: int) -> str:
-    m = max(0, seconds) // 60
-    h = m // 60
-    if h > 0:
-        return f"{h}h{m % 60:02d}m"
-    return f"{m}m"
+logger = logging.getLogger(__name__)
 
+FOOTER_PREFIX = "Upd: "
 
-def render_panel(
-    players: list[tuple[str, Optional[str]]],
-    states: dict[str, object],
-) -> str:
-    now = datetime.now()
-    now_ts = int(now.timestamp())
-    updated_hm = now.strftime("%H:%M")
+
+PAGE_LIMIT = 3900
+HEADER = "🎮 BF6"
+
+# steam_id -> (ключ, готовая строка); ключ меняется только вместе с текстом строки
+LineCache = dict[int, tuple[tuple, str]]
+
+
+def panel_header(games: Optional[dict[str, str]], icon: str = "🎮") -> str:
+    """
+    Заголовок панели: «🎮 BF6» для игры по умолчанию, иначе названия игр чата.
+    """
+    if not games or list(games.values()) == [DEFAULT_TITLE]:
+        return f"{icon} BF6"
+    return f"{icon} " + " / ".join(games.values())
+
+
+def empty_page(games: Optional[dict[str, str]]) -> str:
+    """
+    Пустая страница: хвост панели, когда игроков стало меньше, чем страниц.
+    """
+    return f"{panel_header(games)}\n—"
+
+
+def _player_line(
+    label: str,
+    st: object,
+    now_ts: int,
+    cache: LineCache,
+    steam_id: int,
+    games: Optional[dict[str, str]] = None,
+) -> tuple[bool, str]:
+    is_playing = bool(st and getattr(st, "was_playing_bf6", 0))
+    if is_playing:
+        since_ts = int(getattr(st, "since_ts", None) or now_ts)
+        # у чата несколько игр — в строке видно, в какую именно играет
+        game = games.get(getattr(st, "appid", None) or "", "") if games and len(games) > 1 else ""
+        key = (label, since_ts, (now_ts - since_ts) // 60, game)
+    else:
+        key = (label,)
+
+    hit = cache.get(steam_id)
+    if hit is not None and hit[0] == key:
+        return is_playing, hit[1]
+
+    if is_playing:
+        since_hm = datetime.fromtimestamp(since_ts).strftime("%H:%M")
+        line = f"🟢 {label} {since_hm} ({fmt_duration(now_ts - since_ts)})"
+        if game:
+            line = f"🟢 {label} · {game} {since_hm} ({fmt_duration(now_ts - since_ts)})"
+    else:
+        line = f"⚪ {label}"
+    cache[steam_id] = (key, line)
+    return is_playing, line
+
+
+def _paginate(body: list[str], footer: str, header: str = HEADER) -> list[str]:
+    # запас под заголовок «🎮 BF6 (NN/NN)» и футер
+    budget = PAGE_LIMIT - len(header) - len(footer) - 16
+    chunks: list[list[str]] = [[]]
+    size = 0
+    for line in body:
+        line = line[:budget]
+        if chunks[-1] and size + len(line) + 1 > budget:
+            chunks.append([])
+            size = 0
+        chunks[-1].append(line)
+        size += len(line) + 1
+
+    total = len(chunks)
+    pages = []
+    for i, chunk in enumerate(chunks, 1):
+        title = header if total == 1 else f"{header} ({i}/{total})"
+        pages.append("\n".join([title, *chunk, footer]))
+    return pages
+
+
+def render_pages(
+    players: list[tuple[int, Optional[str]]],
+    states: dict[int, object],
+    now_ts: Optional[int] = None,
+    cache: Optional[LineCache] = None,
+    games: Optional[dict[str, str]] = None,
+) -> list[str]:
+    """
+    Панель, разбитая на страницы не длиннее PAGE_LIMIT (никто не обрезается).
+
+    now_ts — момент, на который считаются длительности и футер.
+    Поллер передаёт время, выровненное по PANEL_REFRESH, чтобы текст
+    менялся не чаще этой каденции. cache — строки игроков с прошлого
+    рендера: пересчитываются только те, у кого поменялись имя, статус
+    или минута длительности. games — игры чата (appid -> название):
+    при нескольких играх у играющих видно название игры.
+    """
+    if now_ts is None:
+        now_ts = int(time.time())
+    if cache is None:
+        cache = {}
+    updated_hm = datetime.fromtimestamp(now_ts).strftime("%H:%M")
 
     playing: list[str] = []
     idle: list[str] = []
 
     for steam_id, name in players:
-        label = (name or steam_id).strip()
-        st = states.get(steam_id)
-
-        is_playing = bool(st and getattr(st, "was_playing_bf6", 0))
-        if is_playing:
-            since_ts = int(getattr(st, "since_ts", None) or now_ts)
-            since_hm = datetime.fromtimestamp(since_ts).strftime("%H:%M")
-            dur = _fmt_duration(now_ts - since_ts)
-            playing.append(f"🟢 {label} {since_hm} ({dur})")
+        label = (name or str(steam_id)).strip()
+        is_playing, line = _player_line(label, states.get(steam_id), now_ts, cache, steam_id, games)
+        (playing if is_playing else idle).append(line)
+
+    body = ["Players online:", *(playing or ["—"]), "Offline:", *(idle or ["—"])]
+    return _paginate(body, f"{FOOTER_PREFIX}{updated_hm}", panel_header(games))
+
+
+def panel_fingerprint(text: str) -> str:
+    """
+    Отпечаток содержимого панели без футера «Upd:» —
+    смена одного лишь времени обновления не повод редактировать сообщение.
+    """
+    body, sep, last = text.rpartition("\n")
+    if sep and last.startswith(FOOTER_PREFIX):
+        text = body
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class PanelTracker:
+    """
+    Память о панелях по каждому чату:
+      - message_id страниц (поллер дописывает новые, в БД — пачкой);
+      - отпечаток последней отправленной версии каждой страницы,
+        чтобы не слать edit_message_text, когда ничего не поменялось;
+      - кэш строк игроков для инкрементального рендера.
+    """
+
+    def __init__(self, refresh_sec: int = 300) -> None:
+        self.refresh_sec = max(1, refresh_sec)
+        self._fingerprints: dict[int, dict[int, str]] = {}
+        self._lines: dict[int, LineCache] = {}
+        self._pages: dict[int, list[int]] = {}
+        self._dirty_pages: set[int] = set()
+
+    def now(self) -> int:
+        """
+        Текущее время, выровненное вниз по каденции обновления.
+        """
+        now_ts = int(time.time())
+        return now_ts - now_ts % self.refresh_sec
+
+    def render(
+        self,
+        chat_id: int,
+        players: list[tuple[int, Optional[str]]],
+        states: dict[int, object],
+        now_ts: Optional[int] = None,
+        games: Optional[dict[str, str]] = None,
+    ) -> list[str]:
+        cache = self._lines.setdefault(chat_id, {})
+        if len(cache) > len(players):
+            # игроков удалили — не копить их строки
+            keep = {sid for sid, _ in players}
+            for sid in [sid for sid in cache if sid not in keep]:
+                del cache[sid]
+        return render_pages(players, states, now_ts, cache, games)
+
+    def changed(self, chat_id: int, text: str, page: int = 0) -> bool:
+        return self._fingerprints.get(chat_id, {}).get(page) != panel_fingerprint(text)
+
+    def remember(self, chat_id: int, text: str, page: int = 0) -> None:
+        self._fingerprints.setdefault(chat_id, {})[page] = panel_fingerprint(text)
+
+    def snapshot(self) -> dict[str, dict[str, str]]:
+        return {
+            str(chat_id): {str(page): fp for page, fp in pages.items()}
+            for chat_id, pages in self._fingerprints.items()
+        }
+
+    def restore(self, data: dict[str, dict[str, str]]) -> None:
+        for chat_id, pages in data.items():
+            self._fingerprints[int(chat_id)] = {int(page): fp for page, fp in pages.items()}
+
+    # -------------------------
+    # Страницы
+    # -------------------------
+    def pages(self, chat_id: int) -> list[int]:
+        return self._pages.get(chat_id, [])
+
+    def items(self):
+        return self._pages.items()
+
+    def set_pages(self, chat_id: int, page_ids: list[int]) -> None:
+        """
+        Страницы, уже записанные в БД (например, хендлером /panel).
+        """
+        self._pages[chat_id] = list(page_ids)
+        self._dirty_pages.discard(chat_id)
+
+    def load_pages(self, rows: list[tuple[int, list[int]]]) -> None:
+        """
+        Страницы из БД; у чатов с ещё не сохранёнными изменениями — свои.
+        """
+        pages = {chat_id: ids for chat_id, ids in rows if ids}
+        for chat_id in self._dirty_pages:
+            if chat_id in self._pages:
+                pages[chat_id] = self._pages[chat_id]
+        self._pages = pages
+
+    def page_sent(self, chat_id: int, page: int, message_id: int, text: str) -> None:
+        self.remember(chat_id, text, page)
+        ids = self._pages.setdefault(chat_id, [])
+        if page < len(ids) and ids[page] == message_id:
+            return
+        if page < len(ids):
+            ids[page] = message_id
+        elif page == len(ids):
+            ids.append(message_id)
         else:
-            idle.append(f"⚪ {label}")
+            return
+        self._dirty_pages.add(chat_id)
 
-    lines: list[str] = []
+    def drop(self, chat_id: int) -> None:
+        """
+        Панели чата больше нет (бота удалили): забываем страницы,
+        отпечатки и строки, а пустой список страниц уйдёт в БД.
+        """
+        self._pages.pop(chat_id, None)
+        self._fingerprints.pop(chat_id, None)
+        self._lines.pop(chat_id, None)
+        self._dirty_pages.add(chat_id)
 
-    # Заголовок
-    lines.append("🎮 BF6")
+    def take_dirty_pages(self) -> dict[int, list[int]]:
+        dirty = {chat_id: list(self._pages.get(chat_id, [])) for chat_id in self._dirty_pages}
+        self._dirty_pages.clear()
+        return dirty
 
-    # Online
-    lines.append("Players online:")
-    if playing:
-        lines.extend(playing)
-    else:
-        lines.append("—")
+    def restore_dirty_pages(self, chat_ids) -> None:
+        self._dirty_pages.update(chat_ids)
 
-    # Offline
-    lines.append("Offline:")
-    if idle:
-        lines.extend(idle)
-    else:
-        lines.append("—")
 
-    # Footer
-    lines.append(f"Upd: {updated_hm}")
+class PanelRefresher:
+    """
+    Канал «панель чата устарела» для команд, меняющих ростер (/addsteam,
+    /importsteam, /games): вместо ожидания тика поллера чат помечается
+    грязным, а одна фоновая задача собирает пачку изменений и перерисовывает
+    все помеченные чаты разом. Ждём, пока пометки не стихнут на window
+    секунд, но не дольше max_delay от первой — серия команд даёт одну
+    правку на чат.
+    """
+
+    def __init__(self, window: float = 2.0, max_delay: float = 10.0) -> None:
+        self.window = window
+        self.max_delay = max(window, max_delay)
+        self._dirty: set[int] = set()
+        self._event = asyncio.Event()
 
-    text = "\n".join(lines)
+    def mark(self, chat_id: int) -> None:
+        self._dirty.add(chat_id)
+        self._event.set()
 
-    # Telegram limit safety
-    if len(text) > 3900:
-        text = text[:3900] + "\n…"
+    async def _settle(self) -> None:
+        start = time.monotonic()
+        while True:
+            self._event.clear()
+            remaining = min(self.window, start + self.max_delay - time.monotonic())
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(self._event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return
 
-    return text
+    async def run(self, refresh: Callable[[set[int]], Awaitable[None]]) -> None:
+        while True:
+            await self._event.wait()
+            await self._settle()
+            chats, self._dirty = self._dirty, set()
+            if not chats:
+                continue
+            try:
+                await refresh(chats)
+            except Exception:
+                logger.exception("Panel refresh error (%d chats)", len(chats))
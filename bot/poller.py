@@ -1,116 +1,634 @@
 import asyncio
 import logging
+import time
+from typing import Optional
 
-from sqlalchemy import select
-
+from bot import metrics, trace
 from bot.config import Config
 from bot.db import session_scope
-from bot.models import Chat
-from bot.panel import render_panel
+from bot.games import GameIndex
+from bot.outbox import Outbox
+from bot.panel import PanelTracker, empty_page
 from bot.repo import (
-    get_panel_message_id,
-    get_states_map,
-    list_players,
-    upsert_chat,
-    upsert_player_state,
+    bulk_set_panel_pages,
+    delete_presence_updates,
+    list_all_players,
+    list_chat_games,
+    list_chats,
+    load_presence_latest,
+    prune_presence_latest,
+    read_presence_updates,
+    upsert_presence_latest,
 )
-from bot.steam import get_player_summaries
+from bot.schedule import PollScheduler
+from bot.state import StateStore
+from bot.quota import SteamUnavailable
+from bot.steam import STEAM_BATCH_SIZE, SteamClient, describe_error
 
 logger = logging.getLogger(__name__)
 
+# не просыпаться чаще, чем раз в MIN_TICK_SEC: due-id успевают набраться в батч
+MIN_TICK_SEC = 5
+
+
+def build_scheduler(cfg: Config) -> PollScheduler:
+    return PollScheduler(
+        online_sec=cfg.poll_online_interval,
+        ingame_sec=cfg.poll_interval,
+        offline_sec=cfg.poll_interval,
+        long_offline_sec=cfg.poll_offline_interval,
+        long_offline_after=cfg.long_offline_after,
+        appids=[cfg.bf6_appid],
+    )
+
+
+def _queue_panel(
+    outbox: Outbox,
+    panels: PanelTracker,
+    chat_id: int,
+    page_ids: list[int],
+    pages: list[str],
+    games: dict[str, str],
+) -> None:
+    # лишние старые страницы не удаляем, а очищаем — пригодятся, когда ростер вырастет
+    pages = pages + [empty_page(games)] * (len(page_ids) - len(pages))
+
+    for page, text in enumerate(pages):
+        # новые страницы создаём по одной и по порядку
+        if page > len(page_ids):
+            break
+        # страница не поменялась — ноль запросов к Bot API
+        if not panels.changed(chat_id, text, page):
+            continue
+        outbox.edit_panel(
+            chat_id,
+            page_ids[page] if page < len(page_ids) else None,
+            text,
+            on_sent=lambda mid, page=page, text=text: panels.page_sent(chat_id, page, mid, text),
+            page=page,
+            on_gone=lambda: panels.drop(chat_id),
+        )
+
+
+def diff_states(
+    games: GameIndex,
+    store: StateStore,
+    watchers: dict[int, list[tuple[int, Optional[str]]]],
+    steam_ids: list[int],
+    summaries: dict[int, dict],
+    now: int,
+) -> dict[int, list[tuple[str, str]]]:
+    """
+    Считает переходы и алерты в памяти (изменения копятся в store как dirty).
+    Смотрит только на опрошенные в этом тике steam_ids. Один summary
+    обслуживает все игры: чаты, смотрящие его gameid, берутся из индекса.
+    Возвращает chat_id -> [(имя для алерта, название игры)].
+    """
+    alerts: dict[int, list[tuple[str, str]]] = {}
+
+    for steam_id in steam_ids:
+        pdata = summaries.get(steam_id)
+        gameid = pdata.get("gameid") if pdata else None
+        appid = str(gameid) if gameid else None
+        chats = games.watching(appid)
+        persona = pdata.get("personaname") if pdata else None
+
+        for chat_id, name in watchers.get(steam_id, ()):
+            playing = appid if chat_id in chats else None
+            should_alert, _ = store.apply(chat_id, steam_id, playing, now, name or persona)
 
-def _chunks(items: list[str], size: int) -> list[list[str]]:
-    return [items[i : i + size] for i in range(0, len(items), size)]
+            if should_alert:
+                display = (name or persona or steam_id)
+                alerts.setdefault(chat_id, []).append((display, games.title(chat_id, playing)))
 
+    return alerts
 
-async def poll_loop(bot, cfg: Config) -> None:
-    # дать боту стартовать
-    await asyncio.sleep(5)
 
-    if not cfg.steam_api_key:
-        logger.warning("STEAM_API_KEY is empty - polling will not work!")
-        return
+class SteamSource:
+    """
+    Источник наблюдений: Steam по адаптивному расписанию.
+    Используется встроенным поллером и воркерами (bot/worker.py).
+    """
+
+    def __init__(self, cfg: Config, steam: SteamClient) -> None:
+        self.cfg = cfg
+        self.steam = steam
+        self.scheduler = build_scheduler(cfg)
+
+    def sync(self, steam_ids, appids=None) -> None:
+        if appids is not None:
+            self.scheduler.appids = set(appids)
+        self.scheduler.sync(steam_ids, time.time())
+        self.steam.retain_seen(self.scheduler)
+
+    def poll_soon(self, steam_ids) -> None:
+        """
+        Опросить id в ближайшем тике (игрок появился в ещё одном чате).
+        """
+        self.scheduler.requeue(steam_ids, time.time())
+
+    def commit(self, changed: list[int], summaries: dict[int, dict]) -> None:
+        """
+        Изменения обработаны (переходы посчитаны, строки записаны):
+        следующий опрос сравнивается уже с ними. Без commit те же id
+        придут изменившимися снова.
+        """
+        self.steam.mark_seen(changed, summaries)
+
+    async def poll(self) -> tuple[list[int], dict[int, dict]]:
+        """
+        Только те id, чьё время пришло, полными батчами.
+        Возвращает (id с изменившимися записями, summaries всех опрошенных).
+        """
+        now = time.time()
+        due_ids = self.scheduler.take_due(now)
+        if not due_ids:
+            return [], {}
 
-    while True:
         try:
-            # 1) достаём все чаты
+            summaries, changed, failed = await self.steam.fetch_changes(due_ids)
+        except SteamUnavailable as e:
+            # breaker открыт или ключи на паузе: вернёмся, когда Steam снова доступен
+            self.scheduler.requeue(due_ids, now + max(MIN_TICK_SEC, e.retry_in))
+            raise
+        except Exception:
+            self.scheduler.requeue(due_ids, now + MIN_TICK_SEC)
+            raise
+
+        if failed:
+            self.scheduler.requeue(failed, time.time() + MIN_TICK_SEC)
+            failed_set = set(failed)
+            due_ids = [sid for sid in due_ids if sid not in failed_set]
+        self._settle(due_ids, summaries)
+        return changed, summaries
+
+    def _settle(self, steam_ids: list[int], summaries: dict[int, dict]) -> None:
+        now = time.time()
+        # при нехватке дневного бюджета интервалы растягиваются
+        self.scheduler.pace = self.steam.keys.pace(now)
+        for sid in steam_ids:
+            self.scheduler.reschedule(sid, summaries.get(sid), now)
+
+    async def stream(self, out: asyncio.Queue, workers: int) -> None:
+        """
+        Как poll, но по батчам: готовый батч сразу уходит в out как
+        (id с изменившимися записями, summaries батча), не дожидаясь остальных.
+        В работе не больше workers батчей, а полная out тормозит загрузку.
+        Неудачный батч возвращается в расписание; исключение — только
+        если не удался ни один.
+        """
+        due_ids = self.scheduler.take_due(time.time())
+        batches = [due_ids[i : i + STEAM_BATCH_SIZE] for i in range(0, len(due_ids), STEAM_BATCH_SIZE)]
+        pending = enumerate(batches)
+        errors: list[Exception] = []
+
+        async def fetch_worker() -> None:
+            for index, batch in pending:
+                try:
+                    with trace.span("steam_batch", batch=index, ids=len(batch)):
+                        summaries, changed = await self.steam.fetch_batch(batch)
+                except SteamUnavailable as e:
+                    self.scheduler.requeue(batch, time.time() + max(MIN_TICK_SEC, e.retry_in))
+                    errors.append(e)
+                    continue
+                except Exception as e:
+                    self.scheduler.requeue(batch, time.time() + MIN_TICK_SEC)
+                    errors.append(e)
+                    continue
+                self._settle(batch, summaries)
+                await out.put((changed, summaries))
+
+        await asyncio.gather(*(fetch_worker() for _ in range(min(max(1, workers), len(batches)))))
+        if errors:
+            if len(errors) == len(batches):
+                raise errors[0]
+            logger.warning(
+                "Steam: %d of %d batches failed this pass: %s",
+                len(errors),
+                len(batches),
+                describe_error(errors[0]),
+            )
+
+    def snapshot(self) -> dict:
+        return {
+            "due": self.scheduler.snapshot(),
+            "seen": self.steam.export_seen(),
+            "quota": self.steam.keys.snapshot(),
+        }
+
+    def restore(self, data: dict) -> None:
+        self.scheduler.restore(data.get("due", {}))
+        self.steam.import_seen(data.get("seen", {}))
+        self.steam.keys.restore(data.get("quota", {}))
+
+    def seconds_until_due(self) -> float:
+        due = self.scheduler.next_due()
+        if due is None:
+            return self.cfg.poll_interval
+        wait = min(max(MIN_TICK_SEC, due - time.time()), self.cfg.poll_interval)
+        return max(wait, self.steam.breaker.retry_in())
+
+
+class FeedSource:
+    """
+    Источник наблюдений: таблица presence_updates, которую наполняют
+    воркеры-поллеры (POLLER_MODE=external). Прочитанное сразу удаляется.
+
+    Воркер пишет строку только при смене игры или ника, поэтому последнее
+    наблюдение по каждому id хранится здесь и в presence_latest (пишется
+    той же транзакцией, что удаляет прочитанное): им отвечаем на poll_soon
+    (игрок появился в ещё одном чате, чат сменил список игр), с ним же
+    поднимаемся после рестарта.
+    """
+
+    def __init__(self, interval: float, batch_size: int = 5000) -> None:
+        self.interval = interval
+        self.batch_size = batch_size
+        self._latest: dict[int, dict] = {}
+        self._soon: set[int] = set()
+
+    async def hydrate(self) -> None:
+        """
+        Последние наблюдения из presence_latest. Первый stream прогоняет их
+        через расчёт переходов: повторный расчёт того же наблюдения ничего
+        не меняет, а обработку, прерванную рестартом, доделывает.
+        """
+        async with session_scope() as session:
+            await prune_presence_latest(session)
+            rows = await load_presence_latest(session)
+            await session.commit()
+        for r in rows:
+            self._latest[r.steam_id] = {
+                "gameid": r.gameid,
+                "personaname": r.personaname,
+                "personastate": r.personastate,
+                "lastlogoff": r.lastlogoff,
+            }
+        self._soon.update(self._latest)
+        logger.info("Loaded %d latest worker observations", len(rows))
+
+    def sync(self, steam_ids, appids=None) -> None:
+        # _latest не чистим: удалённый и тут же добавленный снова игрок
+        # всё ещё в _last воркера, и строки от него не будет
+        self._soon &= set(steam_ids)
+
+    def poll_soon(self, steam_ids) -> None:
+        """
+        В ближайшем stream отдать последние наблюдения этих id.
+        """
+        self._soon.update(steam_ids)
+
+    def commit(self, changed: list[int], summaries: dict[int, dict]) -> None:
+        pass
+
+    async def poll(self) -> tuple[list[int], dict[int, dict]]:
+        async with session_scope() as session:
+            rows = await read_presence_updates(session, self.batch_size)
+            # rows идут по id — для одного steam_id побеждает последнее наблюдение
+            latest = {r.steam_id: r for r in rows}
+            await upsert_presence_latest(
+                session,
+                [
+                    {
+                        "steam_id": r.steam_id,
+                        "gameid": r.gameid,
+                        "personaname": r.personaname,
+                        "personastate": r.personastate,
+                        "lastlogoff": r.lastlogoff,
+                        "observed_ts": r.observed_ts,
+                    }
+                    for r in latest.values()
+                ],
+            )
+            await delete_presence_updates(session, [r.id for r in rows])
+            await session.commit()
+
+        summaries: dict[int, dict] = {
+            sid: {
+                "gameid": r.gameid,
+                "personaname": r.personaname,
+                "personastate": r.personastate,
+                "lastlogoff": r.lastlogoff,
+            }
+            for sid, r in latest.items()
+        }
+        self._latest.update(summaries)
+        return list(summaries), summaries
+
+    def snapshot(self) -> dict:
+        return {}
+
+    def restore(self, data: dict) -> None:
+        pass
+
+    async def stream(self, out: asyncio.Queue, workers: int) -> None:
+        changed, summaries = await self.poll()
+        if self._soon:
+            # id без наблюдений воркер ещё не опрашивал: после первого
+            # опроса (пустой _last) он пришлёт строку сам
+            for sid in self._soon.intersection(self._latest).difference(summaries):
+                summaries[sid] = self._latest[sid]
+            self._soon.clear()
+        if summaries:
+            await out.put((changed, summaries))
+
+    def seconds_until_due(self) -> float:
+        return self.interval
+
+
+class Poller:
+    """
+    Цикл обработки присутствия.
+
+    Наблюдения приходят из источника: SteamSource (встроенный режим —
+    Steam дёргается один раз на уникальный steam_id и только когда его
+    время пришло) или FeedSource (воркеры в отдельных процессах).
+    Summaries раздаются по всем чатам, которые следят за игроком.
+    Состояния живут в StateStore (write-behind), алерты и панели уходят
+    через Outbox, ростер из БД перечитывается раз в POLL_INTERVAL.
+    """
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        cfg: Config,
+        source,
+        store: StateStore,
+        panels: PanelTracker,
+        games: GameIndex,
+    ) -> None:
+        self.outbox = outbox
+        self.cfg = cfg
+        self.source = source
+        self.store = store
+        self.panels = panels
+        self.games = games
+
+        self._roster: dict[int, list[tuple[int, Optional[str]]]] = {}
+        self._watchers: dict[int, list[tuple[int, Optional[str]]]] = {}
+        self._roster_ts: Optional[float] = None
+        self._panel_now: Optional[int] = None
+        # id, у которых поменялись наблюдатели: их надо пересчитать,
+        # даже если батч Steam пришёл без изменений
+        self._fresh: set[int] = set()
+        # будит run() раньше срока, когда команда добавила игроков
+        self._wake = asyncio.Event()
+
+    async def load_roster(self) -> None:
+        async with session_scope() as session:
+            chats = await list_chats(session)
+            roster = await list_all_players(session)
+            chat_games = await list_chat_games(session)
+            await session.commit()
+
+        watchers: dict[int, list[tuple[int, Optional[str]]]] = {}
+        for chat_id, players in roster.items():
+            for steam_id, name in players:
+                watchers.setdefault(steam_id, []).append((chat_id, name))
+
+        fresh = {sid for sid, w in watchers.items() if self._watchers.get(sid) != w}
+        self._fresh |= fresh
+        # при первой загрузке «свежие» все — их сроки даёт снапшот или sync
+        reloaded = self._roster_ts is not None
+        self.panels.load_pages(chats)
+        self.games.load(chat_games, [chat_id for chat_id, _ in chats])
+        self._roster = roster
+        self._watchers = watchers
+        self._roster_ts = time.monotonic()
+        self.source.sync(watchers.keys(), self.games.appids())
+        if fresh and reloaded:
+            self.source.poll_soon(fresh)
+
+        metrics.TRACKED_CHATS.set(len(chats))
+        metrics.TRACKED_PLAYERS.set(len(watchers))
+        metrics.TRACKED_PAIRS.set(sum(len(p) for p in roster.values()))
+
+    async def tick(self) -> None:
+        with metrics.POLL_TICK_SECONDS.time(), trace.tick():
+            await self._tick()
+
+    async def save_pages(self) -> None:
+        """
+        Сохраняет message_id страниц, созданных через outbox.
+        """
+        dirty = self.panels.take_dirty_pages()
+        if not dirty:
+            return
+        try:
             async with session_scope() as session:
-                rows = (await session.execute(select(Chat.chat_id))).all()
-                chat_ids = [r[0] for r in rows]
+                await bulk_set_panel_pages(session, dirty)
                 await session.commit()
+        except Exception:
+            self.panels.restore_dirty_pages(dirty)
+            raise
 
-            # 2) обходим чаты
-            for chat_id in chat_ids:
-                # список игроков
-                async with session_scope() as session:
-                    await upsert_chat(session, chat_id)
-                    players = await list_players(session, chat_id)
-                    panel_id = await get_panel_message_id(session, chat_id)
-                    states = await get_states_map(session, chat_id)
-                    await session.commit()
-
-                steam_ids = [sid for sid, _ in players]
-                if not steam_ids:
-                    # нечего мониторить, но панель можно обновить
-                    if panel_id:
+    async def _tick(self) -> None:
+        stage = metrics.POLL_STAGE_SECONDS
+
+        # 0) новые страницы панелей — в БД до того, как ростер перечитает chats
+        with trace.span("save_pages"):
+            await self.save_pages()
+
+        # 1) ростер — не чаще раза в POLL_INTERVAL
+        if self._roster_ts is None or time.monotonic() - self._roster_ts >= self.cfg.poll_interval:
+            with stage.time("db_load"), trace.span("db_load"):
+                await self.load_roster()
+
+        changed = self._take_game_changes()
+        if changed:
+            self.source.poll_soon(changed)
+
+        # 2-3) конвейер: загрузка батчей -> переходы и алерты. Батч считается,
+        #      пока следующие ещё в пути; очередь между стадиями ограничена,
+        #      и загрузка ждёт, если расчёт отстаёт.
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, self.cfg.pipeline_queue))
+        producer = asyncio.create_task(self._fetch_stage(queue))
+        alerts: dict[int, list[tuple[str, str]]] = {}
+        touched: set[int] = set()
+        diff_sec = 0.0
+        try:
+            with stage.time("steam_fetch"), trace.span("steam_fetch"):
+                batch = 0
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        break
+                    t0 = time.perf_counter()
+                    with trace.span("state_diff", batch=batch, ids=len(item[1])) as sp:
                         try:
-                            await bot.edit_message_text(
-                                chat_id=chat_id,
-                                message_id=panel_id,
-                                text=render_panel(players, states),
-                                parse_mode="Markdown",
-                            )
-                        except Exception:
-                            pass
-                    continue
+                            self._diff_batch(*item, alerts, touched)
+                            self.source.commit(*item)
+                        except Exception as e:
+                            # сбой одного батча не должен стоить остальных
+                            sp.fail(e)
+                            logger.exception("State diff error (%d ids)", len(item[1]))
+                    diff_sec += time.perf_counter() - t0
+                    batch += 1
+            # ошибка загрузки (не удался ни один батч) — наружу
+            await producer
+        finally:
+            producer.cancel()
+        stage.observe(diff_sec, "state_diff")
+        trace.record("state_diff_total", diff_sec)
+
+        # 4) алерты — в outbox разом за тик: так он склеивает имена
+        #    в одно сообщение на чат, а отправка идёт со своей конкурентностью
+        with stage.time("alert_send"), trace.span("alert_send", chats=len(alerts)):
+            for chat_id, names in alerts.items():
+                for display, game in names:
+                    self.outbox.alert(chat_id, display, game)
+
+        # 5) панели — по разу на затронутый чат за тик, а при смене
+        #    каденции PANEL_REFRESH — у всех
+        with stage.time("panel_edit"), trace.span("panel_edit"):
+            panel_now = self.panels.now()
+            if panel_now != self._panel_now:
+                self._panel_now = panel_now
+                touched = None
 
-                # Steam API: батчим по 100
-                summaries_all: dict[str, dict] = {}
-                for batch in _chunks(steam_ids, 100):
-                    summaries_all.update(await get_player_summaries(cfg.steam_api_key, batch))
-
-                # 3) обновляем состояния + шлём алерты
-                async with session_scope() as session:
-                    for steam_id, name in players:
-                        pdata = summaries_all.get(steam_id)
-                        gameid = pdata.get("gameid") if pdata else None
-                        is_playing_bf6 = str(gameid) == str(cfg.bf6_appid)
-
-                        should_alert = await upsert_player_state(
-                            session=session,
-                            chat_id=chat_id,
-                            steam_id=steam_id,
-                            is_playing_bf6=is_playing_bf6,
-                        )
-
-                        if should_alert:
-                            display = (name or (pdata.get("personaname") if pdata else None) or steam_id)
-                            await bot.send_message(
+            for chat_id, page_ids in list(self.panels.items()):
+                if page_ids and (touched is None or chat_id in touched):
+                    with trace.span("panel_render", chat_id=chat_id) as sp:
+                        try:
+                            players = self._roster.get(chat_id, [])
+                            games = self.games.games(chat_id)
+                            pages = self.panels.render(
                                 chat_id,
-                                f"🎮 **{display}** запустил **Battlefield 6**!",
-                                parse_mode="Markdown",
+                                players,
+                                self.store.chat_states(chat_id),
+                                panel_now,
+                                games,
                             )
+                            _queue_panel(self.outbox, self.panels, chat_id, page_ids, pages, games)
+                        except Exception as e:
+                            sp.fail(e)
+                            logger.exception("Panel render error in chat %s", chat_id)
 
-                    await session.commit()
-
-                # 4) обновляем панель (берём актуальные states после commit)
-                if panel_id:
-                    async with session_scope() as session:
-                        players_now = await list_players(session, chat_id)
-                        states_now = await get_states_map(session, chat_id)
-                        await session.commit()
-
-                    try:
-                        await bot.edit_message_text(
-                            chat_id=chat_id,
-                            message_id=panel_id,
-                            text=render_panel(players_now, states_now),
-                            parse_mode="Markdown",
-                        )
-                    except Exception:
-                        pass
+    def _take_game_changes(self) -> set[int]:
+        # чаты, сменившие список игр (/games): их игроков пересчитываем
+        # в ближайшем тике, не дожидаясь изменений в Steam
+        changed_games = self.games.take_changed()
+        if not changed_games:
+            return set()
+        ids = {sid for chat_id in changed_games for sid, _ in self._roster.get(chat_id, ())}
+        self._fresh |= ids
+        self.source.sync(self._watchers.keys(), self.games.appids())
+        return ids
 
-        except Exception:
-            logger.exception("Polling error")
+    async def refresh_chats(self, chat_ids: set[int]) -> None:
+        """
+        Вызывается PanelRefresher после команд, поменявших ростер или игры:
+        ростер этих чатов перечитывается из БД (только их строки), новые
+        игроки сразу попадают в расписание, панели перерисовываются сейчас,
+        а не на ближайшем тике.
+        """
+        with trace.span("panel_refresh", chats=len(chat_ids)):
+            async with session_scope() as session:
+                rosters = await list_all_players(session, chat_ids)
+                await session.commit()
+
+            fresh: set[int] = set()
+            for chat_id in chat_ids:
+                fresh |= self._replace_roster(chat_id, rosters.get(chat_id, []))
+            if fresh:
+                self.source.sync(self._watchers.keys(), self.games.appids())
+            fresh |= self._take_game_changes()
+            if fresh:
+                # новых и пересчитываемых игроков опросим, не дожидаясь срока
+                self.source.poll_soon(fresh)
+                self._wake.set()
+
+            panel_now = self.panels.now()
+            for chat_id in chat_ids:
+                page_ids = self.panels.pages(chat_id)
+                if not page_ids:
+                    continue
+                try:
+                    games = self.games.games(chat_id)
+                    pages = self.panels.render(
+                        chat_id,
+                        self._roster.get(chat_id, []),
+                        self.store.chat_states(chat_id),
+                        panel_now,
+                        games,
+                    )
+                    _queue_panel(self.outbox, self.panels, chat_id, page_ids, pages, games)
+                except Exception:
+                    logger.exception("Panel render error in chat %s", chat_id)
+
+    def _replace_roster(self, chat_id: int, players: list[tuple[int, Optional[str]]]) -> set[int]:
+        """
+        Подменяет ростер одного чата и его записи в _watchers.
+        Возвращает id, которые чат теперь смотрит и которые надо пересчитать.
+        """
+        old = self._roster.get(chat_id, [])
+        if old == players:
+            return set()
+        names = dict(players)
+        fresh = set(names.keys() - dict(old).keys())
+        for sid in {sid for sid, _ in old} | names.keys():
+            watchers = [(c, n) for c, n in self._watchers.get(sid, ()) if c != chat_id]
+            if sid in names:
+                watchers.append((chat_id, names[sid]))
+            if watchers:
+                self._watchers[sid] = watchers
+            else:
+                self._watchers.pop(sid, None)
+        if players:
+            self._roster[chat_id] = players
+            # чат мог появиться после load_roster: без индекса его игроков
+            # diff_states счёл бы «не играющими»
+            self.games.add_chat(chat_id)
+        else:
+            self._roster.pop(chat_id, None)
+        self._fresh |= fresh
+        return fresh
+
+    async def _fetch_stage(self, queue: asyncio.Queue) -> None:
+        try:
+            await self.source.stream(queue, self.cfg.pipeline_fetch_workers)
+        finally:
+            await queue.put(None)
+
+    def _diff_batch(
+        self,
+        due_ids: list[int],
+        summaries: dict[int, dict],
+        alerts: dict[int, list[tuple[str, str]]],
+        touched: set[int],
+    ) -> None:
+        # id, чьи наблюдатели поменялись, считаем даже из неизменившегося батча
+        if self._fresh:
+            polled = self._fresh.intersection(summaries).difference(due_ids)
+            self._fresh.difference_update(summaries)
+            due_ids = due_ids + list(polled)
+        if not due_ids:
+            return
+
+        found = diff_states(self.games, self.store, self._watchers, due_ids, summaries, int(time.time()))
+        for chat_id, names in found.items():
+            alerts.setdefault(chat_id, []).extend(names)
+        touched.update(chat_id for sid in due_ids for chat_id, _ in self._watchers.get(sid, ()))
+
+    async def run(self) -> None:
+        # первый проход — сразу: расписание из снапшота решает, кого опрашивать
+        first = True
+        while True:
+            try:
+                await self.tick()
+            except SteamUnavailable as e:
+                metrics.POLL_ERRORS.inc()
+                logger.warning("Polling skipped: %s", e)
+            except Exception:
+                metrics.POLL_ERRORS.inc()
+                logger.exception("Polling error")
+
+            if first:
+                first = False
+                logger.info("First sweep done %.2fs after start", metrics.mark_startup("first_sweep"))
 
-        await asyncio.sleep(cfg.poll_interval)
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.source.seconds_until_due())
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
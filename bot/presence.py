@@ -0,0 +1,58 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(slots=True)
+class PresenceState:
+    """
+    Лёгкая копия строки player_states для расчётов в памяти.
+    Поля названы так же, как в модели PlayerState, чтобы render_pages
+    одинаково работал и с ORM-объектами, и с этими записями.
+    Без __dict__: таких записей по одной на пару чат×игрок.
+    """
+
+    was_playing_bf6: int = 0
+    since_ts: Optional[int] = None
+    last_alert_ts: Optional[int] = None
+    # игра текущей (или последней) сессии; None — записано до мультиигр
+    appid: Optional[str] = None
+
+
+def apply_presence(
+    state: PresenceState,
+    appid: Optional[str],
+    now: int,
+    alert_cooldown_sec: int = 300,
+) -> tuple[bool, bool]:
+    """
+    Применяет новое наблюдение к состоянию (in-place).
+    appid — в какую из отслеживаемых чатом игр игрок сейчас играет
+    (None — ни в какую). Поле was_playing_bf6 значит «играет в одну из них».
+    Возвращает (should_alert, changed).
+    """
+    if appid and state.was_playing_bf6 and state.appid is None:
+        # сессия началась до мультиигр — это была игра по умолчанию, не переход
+        state.appid = appid
+
+    # Переход: не играл -> играет, или сменил одну отслеживаемую игру на другую
+    if appid and (not state.was_playing_bf6 or appid != state.appid):
+        same_game = appid == state.appid
+        state.was_playing_bf6 = 1
+        state.since_ts = now
+        state.appid = appid
+
+        # антифлуд: если уже алертили недавно про эту же игру, то не алертим снова
+        last_alert = int(state.last_alert_ts) if state.last_alert_ts else 0
+        if not same_game or now - last_alert >= alert_cooldown_sec:
+            state.last_alert_ts = now
+            return True, True
+        return False, True
+
+    # Переход: играл -> не играет (appid остаётся — для антифлуда)
+    if (not appid) and state.was_playing_bf6:
+        state.was_playing_bf6 = 0
+        state.since_ts = None
+        return False, True
+
+    # Ничего не поменялось
+    return False, False
@@ -0,0 +1,126 @@
+"""
+Сэмплирующий профайлер event loop по требованию (/profile или SIGUSR1).
+
+Пока профиль не запущен, ничего не работает. Запуск поднимает поток,
+который каждые interval_ms снимает стек главного потока
+(sys._current_frames) — сам цикл событий не трогается. Через seconds
+секунд стеки пишутся в PROFILE_DIR в формате collapsed stacks
+(«a;b;c N» — flamegraph.pl, speedscope, inferno).
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_SECONDS = 600
+# глубже — только шум asyncio/aiohttp
+MAX_DEPTH = 64
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _sample(thread_id: int, interval: float, stop: threading.Event, stacks: Counter) -> None:
+    while not stop.wait(interval):
+        frame = sys._current_frames().get(thread_id)
+        stack: list[str] = []
+        while frame is not None and len(stack) < MAX_DEPTH:
+            stack.append(_frame_label(frame))
+            frame = frame.f_back
+        if stack:
+            stacks[";".join(reversed(stack))] += 1
+
+
+def _write(path: str, stacks: Counter) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+
+def top_frames(stacks: Counter, limit: int = 10) -> list[tuple[str, int]]:
+    """
+    Самые частые верхушки стека (собственное время функций).
+    """
+    leaves: Counter = Counter()
+    for stack, count in stacks.items():
+        leaves[stack.rsplit(";", 1)[-1]] += count
+    return leaves.most_common(limit)
+
+
+class Profiler:
+    """
+    Один профиль за раз. run() вызывается из event loop, который и профилируется.
+    """
+
+    def __init__(
+        self,
+        out_dir: str,
+        default_seconds: int = 30,
+        interval_ms: float = 5.0,
+        admins: Iterable[int] = (),
+    ) -> None:
+        self.out_dir = out_dir
+        # Telegram user id, которым разрешён /profile
+        self.admins = frozenset(admins)
+        self.default_seconds = default_seconds
+        self.interval = max(0.001, interval_ms / 1000)
+        self._running = False
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    async def run(self, seconds: Optional[int] = None) -> Optional[tuple[str, Counter]]:
+        """
+        Снимает профиль; (путь к файлу, стеки) или None, если профиль уже идёт.
+        """
+        if self._running:
+            return None
+        seconds = min(MAX_SECONDS, max(1, seconds or self.default_seconds))
+        self._running = True
+        stacks: Counter = Counter()
+        stop = threading.Event()
+        sampler = threading.Thread(
+            target=_sample,
+            args=(threading.get_ident(), self.interval, stop, stacks),
+            name="profiler",
+            daemon=True,
+        )
+        logger.info("Profiling the event loop for %ds", seconds)
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            await asyncio.to_thread(sampler.join)
+            self._running = False
+
+        path = os.path.join(self.out_dir, time.strftime("profile-%Y%m%d-%H%M%S.folded"))
+        await asyncio.to_thread(_write, path, stacks)
+        logger.info("Profile written to %s (%d samples)", path, sum(stacks.values()))
+        return path, stacks
+
+    def start_background(self, seconds: Optional[int] = None) -> None:
+        """
+        Для обработчика сигнала: профиль в фоне, результат — только в лог.
+        """
+        if self._running:
+            logger.warning("Profile is already running")
+            return
+        self._task = asyncio.get_running_loop().create_task(self.run(seconds))
+        self._task.add_done_callback(_log_failure)
+
+
+def _log_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Profile failed", exc_info=task.exception())
@@ -0,0 +1,237 @@
+"""
+Пул ключей Steam Web API с учётом квот и circuit breaker для всего опроса.
+
+У каждого ключа — свой темп (token bucket, запросов/сек) и дневной лимит
+(~100k вызовов/сутки у Steam). Запрос уходит с наименее загруженного
+ключа; ключ, получивший 429/403, отдыхает. Отсчёт суток — по UTC.
+"""
+import asyncio
+import hashlib
+import time
+from dataclasses import dataclass, field
+from typing import Optional, Sequence
+
+from bot.ratelimit import TokenBucket
+
+DAY_SEC = 86400
+# во сколько раз можно растянуть интервалы опроса, экономя дневной бюджет
+MAX_PACE = 60.0
+
+
+class SteamUnavailable(Exception):
+    """
+    Steam сейчас не опрашиваем: открыт circuit breaker или исчерпаны квоты всех ключей.
+    """
+
+    def __init__(self, reason: str, retry_in: float) -> None:
+        super().__init__(f"{reason} (retry in {retry_in:.0f}s)")
+        self.retry_in = retry_in
+
+
+def _utc_day(ts: float) -> int:
+    return int(ts // DAY_SEC)
+
+
+def key_fingerprint(key: str) -> str:
+    """
+    Короткий отпечаток ключа — для метрик и снапшота вместо самого ключа.
+    """
+    return hashlib.blake2b(key.encode(), digest_size=4).hexdigest()
+
+
+@dataclass
+class ApiKey:
+    key: str
+    bucket: TokenBucket
+    daily_limit: int
+    day: int = 0
+    used: int = 0
+    in_flight: int = 0
+    cooldown_until: float = 0.0
+    name: str = field(default="")
+
+    def __post_init__(self) -> None:
+        self.name = self.name or key_fingerprint(self.key)
+
+    def roll(self, now: float) -> None:
+        day = _utc_day(now)
+        if day != self.day:
+            self.day = day
+            self.used = 0
+
+    def left(self) -> int:
+        return max(0, self.daily_limit - self.used) if self.daily_limit > 0 else 1 << 62
+
+    def load(self) -> float:
+        if self.daily_limit <= 0:
+            return float(self.in_flight)
+        return (self.used + self.in_flight) / self.daily_limit
+
+
+class KeyPool:
+    """
+    Набор ключей: выбор наименее загруженного, учёт вызовов за сутки,
+    отдых ключа после 429/403 и коэффициент замедления опроса
+    по остатку дневного бюджета.
+    """
+
+    def __init__(
+        self,
+        keys: Sequence[str],
+        rate_per_sec: float = 5.0,
+        daily_limit: int = 100000,
+        max_wait: float = 10.0,
+    ) -> None:
+        # без ключа (POLLER_MODE=external) пул всё равно не пустой — запросы просто получат 403
+        keys = [k for k in keys if k] or [""]
+        now = time.time()
+        self.keys = [ApiKey(k, TokenBucket(rate_per_sec), daily_limit, day=_utc_day(now)) for k in keys]
+        # короткий отдых ключей (Retry-After в пару секунд) пережидаем на месте
+        self.max_wait = max_wait
+        self._lock = asyncio.Lock()
+
+    def _available(self, now: float) -> list[ApiKey]:
+        for k in self.keys:
+            k.roll(now)
+        return [k for k in self.keys if k.left() > 0 and k.cooldown_until <= time.monotonic()]
+
+    async def acquire(self) -> ApiKey:
+        """
+        Ключ для одного запроса (уже с учётом его темпа). Вызов учитывается сразу.
+        """
+        async with self._lock:
+            while True:
+                now = time.time()
+                candidates = self._available(now)
+                if not candidates:
+                    retry_in = self.retry_in(now)
+                    if retry_in > self.max_wait:
+                        raise SteamUnavailable("no Steam API key available", retry_in)
+                    await asyncio.sleep(retry_in)
+                    continue
+
+                # ключ со свободным токеном — раньше; среди них — наименее загруженный
+                key = min(candidates, key=lambda k: (k.bucket.delay() > 0, k.load()))
+                wait = key.bucket.consume()
+                if wait <= 0:
+                    key.used += 1
+                    key.in_flight += 1
+                    return key
+                await asyncio.sleep(wait)
+
+    def release(self, key: ApiKey) -> None:
+        key.in_flight = max(0, key.in_flight - 1)
+
+    def cool_down(self, key: ApiKey, seconds: float) -> None:
+        key.cooldown_until = max(key.cooldown_until, time.monotonic() + seconds)
+
+    def retry_in(self, now: Optional[float] = None) -> float:
+        """
+        Через сколько секунд появится хоть один ключ.
+        """
+        now = time.time() if now is None else now
+        mono = time.monotonic()
+        waits = []
+        for k in self.keys:
+            if k.left() > 0:
+                waits.append(max(0.0, k.cooldown_until - mono))
+            else:
+                waits.append(DAY_SEC - now % DAY_SEC)
+        return min(waits)
+
+    def budget_left(self, now: Optional[float] = None) -> float:
+        """
+        Доля дневного бюджета, оставшаяся на все ключи (1.0 — без лимита).
+        """
+        now = time.time() if now is None else now
+        limited = [k for k in self.keys if k.daily_limit > 0]
+        if not limited:
+            return 1.0
+        for k in limited:
+            k.roll(now)
+        total = sum(k.daily_limit for k in limited)
+        return sum(k.left() for k in limited) / total
+
+    def pace(self, now: Optional[float] = None) -> float:
+        """
+        Во сколько раз растянуть интервалы опроса, чтобы при текущем темпе
+        бюджета хватило до конца суток (UTC). 1.0 — укладываемся.
+        """
+        now = time.time() if now is None else now
+        limited = [k for k in self.keys if k.daily_limit > 0]
+        if not limited:
+            return 1.0
+        for k in limited:
+            k.roll(now)
+
+        elapsed = max(3600.0, now % DAY_SEC)  # средний темп с начала суток, не по первым минутам
+        remaining_sec = DAY_SEC - now % DAY_SEC
+        used = sum(k.used for k in limited)
+        left = sum(k.left() for k in limited)
+        need = used / elapsed * remaining_sec
+        if need <= left:
+            return 1.0
+        if left <= 0:
+            return MAX_PACE
+        return min(MAX_PACE, need / left)
+
+    def snapshot(self) -> dict[str, list[int]]:
+        return {k.name: [k.day, k.used] for k in self.keys}
+
+    def restore(self, data: dict[str, list[int]]) -> None:
+        for k in self.keys:
+            day, used = data.get(k.name, (0, 0))
+            if day == k.day:
+                k.used = max(k.used, int(used))
+
+
+class CircuitBreaker:
+    """
+    После threshold неудачных батчей подряд Steam считается деградировавшим:
+    запросы не уходят reset_sec секунд, затем пропускается один пробный
+    (half-open) — успех закрывает breaker, неудача открывает снова.
+    """
+
+    def __init__(self, threshold: int = 5, reset_sec: float = 60.0) -> None:
+        self.threshold = max(1, threshold)
+        self.reset_sec = reset_sec
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def retry_in(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_sec - time.monotonic())
+
+    def check(self) -> None:
+        """
+        Бросает SteamUnavailable, если запрос сейчас пускать нельзя.
+        """
+        if self._opened_at is None:
+            return
+        wait = self.retry_in()
+        if wait > 0 or self._probe:
+            raise SteamUnavailable("Steam circuit breaker is open", max(wait, 1.0))
+        self._probe = True
+
+    def abort(self) -> None:
+        """
+        Пробный запрос так и не ушёл (например, нет свободного ключа) — пустим следующий.
+        """
+        self._probe = False
+
+    def success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._probe = False
+
+    def failure(self) -> None:
+        self._failures += 1
+        self._probe = False
+        if self._opened_at is not None or self._failures >= self.threshold:
+            self._opened_at = time.monotonic()
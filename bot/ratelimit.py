@@ -0,0 +1,41 @@
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Классический token bucket: rate токенов в секунду, не больше capacity.
+    rate <= 0 — без ограничения.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._ts = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._ts) * self.rate)
+        self._ts = now
+
+    def delay(self, n: float = 1.0) -> float:
+        """
+        Сколько секунд ждать, пока наберётся n токенов (без списания).
+        """
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        if self._tokens >= n:
+            return 0.0
+        return (n - self._tokens) / self.rate
+
+    def consume(self, n: float = 1.0) -> float:
+        """
+        Пытается списать n токенов без ожидания.
+        Возвращает 0, если получилось, иначе — сколько секунд ждать до появления токенов.
+        """
+        wait = self.delay(n)
+        if wait <= 0 and self.rate > 0:
+            self._tokens -= n
+        return wait
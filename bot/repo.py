@@ -1,49 +1,156 @@
-import time
-from typing import Optional
+from typing import Iterable, Optional
 
-from sqlalchemy import select, update
-from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy import bindparam, case, delete, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from bot.models import Chat, Player, PlayerState
+from bot.db import dialect_insert
+from bot.models import (
+    Chat,
+    ChatGame,
+    PlaySession,
+    PlayStatDaily,
+    Player,
+    PlayerState,
+    PollerWorker,
+    PresenceLatest,
+    PresenceUpdate,
+    ShardLease,
+    VanityCache,
+)
+from bot.presence import PresenceState
+from bot.stats import day_key
 
 
 # -------------------------
 # Chats
 # -------------------------
 async def upsert_chat(session: AsyncSession, chat_id: int) -> None:
-    stmt = sqlite_insert(Chat).values(chat_id=chat_id).on_conflict_do_nothing(
+    stmt = dialect_insert(Chat).values(chat_id=chat_id).on_conflict_do_nothing(
         index_elements=[Chat.chat_id]
     )
     await session.execute(stmt)
 
 
-async def set_panel_message_id(session: AsyncSession, chat_id: int, message_id: int) -> None:
-    stmt = update(Chat).where(Chat.chat_id == chat_id).values(panel_message_id=message_id)
-    await session.execute(stmt)
+def _panel_pages(first: Optional[int], extra: Optional[str]) -> list[int]:
+    if not first:
+        return []
+    return [first] + [int(x) for x in (extra or "").split(",") if x]
+
+
+def _panel_values(page_ids: list[int]) -> dict:
+    return {
+        "panel_message_id": page_ids[0] if page_ids else None,
+        "panel_page_ids": ",".join(str(x) for x in page_ids[1:]) or None,
+    }
 
 
-async def get_panel_message_id(session: AsyncSession, chat_id: int) -> Optional[int]:
-    stmt = select(Chat.panel_message_id).where(Chat.chat_id == chat_id)
+async def get_panel_pages(session: AsyncSession, chat_id: int) -> list[int]:
+    """
+    message_id всех страниц панели по порядку (пусто — панели нет).
+    """
+    stmt = select(Chat.panel_message_id, Chat.panel_page_ids).where(Chat.chat_id == chat_id)
     row = (await session.execute(stmt)).first()
-    return row[0] if row else None
+    return _panel_pages(row[0], row[1]) if row else []
+
+
+async def set_panel_pages(session: AsyncSession, chat_id: int, page_ids: list[int]) -> None:
+    stmt = update(Chat).where(Chat.chat_id == chat_id).values(**_panel_values(page_ids))
+    await session.execute(stmt)
+
+
+async def bulk_set_panel_pages(session: AsyncSession, pages: dict[int, list[int]]) -> None:
+    """
+    pages: chat_id -> [message_id страниц]; один executemany UPDATE.
+    """
+    if not pages:
+        return
+    table = Chat.__table__
+    stmt = (
+        update(table)
+        .where(table.c.chat_id == bindparam("b_chat_id"))
+        .values(
+            panel_message_id=bindparam("b_first"),
+            panel_page_ids=bindparam("b_extra"),
+        )
+    )
+    rows = []
+    for chat_id, page_ids in pages.items():
+        values = _panel_values(page_ids)
+        rows.append(
+            {
+                "b_chat_id": chat_id,
+                "b_first": values["panel_message_id"],
+                "b_extra": values["panel_page_ids"],
+            }
+        )
+    await session.execute(stmt, rows)
+
+
+async def list_chats(session: AsyncSession) -> list[tuple[int, list[int]]]:
+    """
+    Возвращает все чаты: [(chat_id, [message_id страниц панели]), ...].
+    """
+    stmt = select(Chat.chat_id, Chat.panel_message_id, Chat.panel_page_ids).order_by(Chat.chat_id)
+    rows = (await session.execute(stmt)).all()
+    return [(r[0], _panel_pages(r[1], r[2])) for r in rows]
+
+
+# -------------------------
+# Chat games
+# -------------------------
+async def list_chat_games(session: AsyncSession) -> dict[int, dict[str, str]]:
+    """
+    Явные списки игр всех чатов: chat_id -> {appid: title}.
+    Чатов без строк здесь нет — они смотрят игру по умолчанию.
+    """
+    stmt = select(ChatGame.chat_id, ChatGame.appid, ChatGame.title).order_by(ChatGame.chat_id, ChatGame.appid)
+    games: dict[int, dict[str, str]] = {}
+    for chat_id, appid, title in (await session.execute(stmt)).all():
+        games.setdefault(chat_id, {})[appid] = title
+    return games
+
 
+async def get_chat_games(session: AsyncSession, chat_id: int) -> dict[str, str]:
+    stmt = select(ChatGame.appid, ChatGame.title).where(ChatGame.chat_id == chat_id).order_by(ChatGame.appid)
+    return {r[0]: r[1] for r in (await session.execute(stmt)).all()}
 
-async def clear_panel_message_id(session: AsyncSession, chat_id: int) -> None:
-    stmt = update(Chat).where(Chat.chat_id == chat_id).values(panel_message_id=None)
+
+async def add_chat_game(session: AsyncSession, chat_id: int, appid: str, title: str) -> None:
+    stmt = dialect_insert(ChatGame).values(chat_id=chat_id, appid=appid, title=title)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ChatGame.chat_id, ChatGame.appid],
+        set_={"title": title},
+    )
     await session.execute(stmt)
 
 
+async def remove_chat_game(session: AsyncSession, chat_id: int, appid: str) -> bool:
+    stmt = delete(ChatGame).where(ChatGame.chat_id == chat_id, ChatGame.appid == appid)
+    return (await session.execute(stmt)).rowcount > 0
+
+
+async def list_watched_appids(session: AsyncSession, default_appid: str) -> set[str]:
+    """
+    Все appid, которые смотрит хоть один чат (для расписания воркеров).
+    Игра по умолчанию — если есть чат без явного списка.
+    """
+    appids = {r[0] for r in (await session.execute(select(ChatGame.appid).distinct())).all()}
+    stmt = select(Chat.chat_id).where(~Chat.chat_id.in_(select(ChatGame.chat_id))).limit(1)
+    if not appids or (await session.execute(stmt)).first():
+        appids.add(str(default_appid))
+    return appids
+
+
 # -------------------------
 # Players
 # -------------------------
 async def add_player(
     session: AsyncSession,
     chat_id: int,
-    steam_id: str,
+    steam_id: int,
     display_name: Optional[str],
 ) -> None:
-    stmt = sqlite_insert(Player).values(
+    stmt = dialect_insert(Player).values(
         chat_id=chat_id,
         steam_id=steam_id,
         display_name=display_name,
@@ -54,7 +161,30 @@ async def add_player(
     await session.execute(stmt)
 
 
-async def list_players(session: AsyncSession, chat_id: int) -> list[tuple[str, Optional[str]]]:
+async def bulk_add_players(
+    session: AsyncSession,
+    chat_id: int,
+    players: list[tuple[int, Optional[str]]],
+) -> None:
+    """
+    Импорт ростера: все игроки одним executemany (upsert, как add_player).
+    Имя не затирается пустым, если у строки импорта его нет.
+    """
+    if not players:
+        return
+    table = Player.__table__
+    stmt = dialect_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.chat_id, table.c.steam_id],
+        set_={"display_name": func.coalesce(stmt.excluded.display_name, table.c.display_name)},
+    )
+    await session.execute(
+        stmt,
+        [{"chat_id": chat_id, "steam_id": sid, "display_name": name} for sid, name in players],
+    )
+
+
+async def list_players(session: AsyncSession, chat_id: int) -> list[tuple[int, Optional[str]]]:
     stmt = (
         select(Player.steam_id, Player.display_name)
         .where(Player.chat_id == chat_id)
@@ -64,73 +194,347 @@ async def list_players(session: AsyncSession, chat_id: int) -> list[tuple[str, O
     return [(r[0], r[1]) for r in rows]
 
 
+async def list_all_players(
+    session: AsyncSession,
+    chat_ids: Optional[Iterable[int]] = None,
+) -> dict[int, list[tuple[int, Optional[str]]]]:
+    """
+    Один запрос на все чаты (или только chat_ids): chat_id -> [(steam_id, display_name), ...].
+    Один и тот же steam_id во всех чатах — один и тот же объект int.
+    """
+    stmt = select(Player.chat_id, Player.steam_id, Player.display_name).order_by(
+        Player.chat_id, Player.steam_id
+    )
+    if chat_ids is not None:
+        stmt = stmt.where(Player.chat_id.in_(list(chat_ids)))
+    rows = (await session.execute(stmt)).all()
+
+    roster: dict[int, list[tuple[int, Optional[str]]]] = {}
+    ids: dict[int, int] = {}
+    for chat_id, steam_id, name in rows:
+        roster.setdefault(chat_id, []).append((ids.setdefault(steam_id, steam_id), name))
+    return roster
+
+
+async def list_steam_ids(session: AsyncSession) -> list[int]:
+    """
+    Все уникальные steam_id по всем чатам.
+    """
+    stmt = select(Player.steam_id).distinct()
+    rows = (await session.execute(stmt)).all()
+    return [r[0] for r in rows]
+
+
 # -------------------------
-# States
+# Bulk
 # -------------------------
-async def get_states_map(session: AsyncSession, chat_id: int) -> dict[str, PlayerState]:
+async def load_tracked(
+    session: AsyncSession,
+) -> tuple[
+    dict[int, list[tuple[int, Optional[str]]]],
+    dict[int, dict[int, PresenceState]],
+]:
     """
-    Возвращает словарь steam_id -> PlayerState для данного чата.
+    Один запрос: все игроки всех чатов вместе с их состояниями (LEFT JOIN).
+    Возвращает (roster, states):
+      roster: chat_id -> [(steam_id, display_name), ...]
+      states: chat_id -> {steam_id: PresenceState}
     """
-    stmt = select(PlayerState).where(PlayerState.chat_id == chat_id)
-    rows = (await session.execute(stmt)).scalars().all()
-    return {r.steam_id: r for r in rows}
+    stmt = (
+        select(
+            Player.chat_id,
+            Player.steam_id,
+            Player.display_name,
+            PlayerState.was_playing_bf6,
+            PlayerState.since_ts,
+            PlayerState.last_alert_ts,
+            PlayerState.appid,
+        )
+        .outerjoin(
+            PlayerState,
+            (PlayerState.chat_id == Player.chat_id) & (PlayerState.steam_id == Player.steam_id),
+        )
+        .order_by(Player.chat_id, Player.steam_id)
+    )
+    rows = (await session.execute(stmt)).all()
+
+    roster: dict[int, list[tuple[int, Optional[str]]]] = {}
+    states: dict[int, dict[int, PresenceState]] = {}
+    ids: dict[int, int] = {}
+    appids: dict[str, str] = {}
+    for chat_id, steam_id, name, was_playing, since_ts, last_alert_ts, appid in rows:
+        steam_id = ids.setdefault(steam_id, steam_id)
+        roster.setdefault(chat_id, []).append((steam_id, name))
+        states.setdefault(chat_id, {})[steam_id] = PresenceState(
+            was_playing_bf6=int(was_playing or 0),
+            since_ts=since_ts,
+            last_alert_ts=last_alert_ts,
+            appid=appids.setdefault(appid, appid) if appid else None,
+        )
+    return roster, states
 
 
-async def upsert_player_state(
+async def bulk_upsert_states(session: AsyncSession, rows: list[dict]) -> None:
+    """
+    Пишет изменившиеся состояния одним executemany INSERT ... ON CONFLICT DO UPDATE.
+    rows: [{chat_id, steam_id, was_playing_bf6, since_ts, last_alert_ts, appid}, ...]
+    """
+    if not rows:
+        return
+
+    # Core-таблица, а не ORM-класс: ORM bulk insert дробит executemany
+    # по набору не-None колонок, а нам нужен ровно один executemany.
+    table = PlayerState.__table__
+    stmt = dialect_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.chat_id, table.c.steam_id],
+        set_={
+            "was_playing_bf6": stmt.excluded.was_playing_bf6,
+            "since_ts": stmt.excluded.since_ts,
+            "last_alert_ts": stmt.excluded.last_alert_ts,
+            "appid": stmt.excluded.appid,
+        },
+    )
+    await session.execute(stmt, rows)
+
+
+# -------------------------
+# Vanity cache
+# -------------------------
+async def get_cached_vanity(
     session: AsyncSession,
-    chat_id: int,
-    steam_id: str,
-    is_playing_bf6: bool,
-    alert_cooldown_sec: int = 300,
-) -> bool:
+    names: list[str],
+    fresh_after: int,
+) -> dict[str, Optional[int]]:
     """
-    Обновляет состояние игрока.
-    Возвращает True, если нужно отправить алерт (первый вход в BF6 или после cooldown).
+    Свежие (resolved_ts >= fresh_after) записи кэша: vanity -> steam_id или None.
+    """
+    if not names:
+        return {}
+    stmt = select(VanityCache.vanity, VanityCache.steam_id).where(
+        VanityCache.vanity.in_(names),
+        VanityCache.resolved_ts >= fresh_after,
+    )
+    return {r[0]: r[1] for r in (await session.execute(stmt)).all()}
 
-    alert_cooldown_sec: защита от "дребезга" статуса (по умолчанию 5 минут).
+
+async def put_cached_vanity(session: AsyncSession, resolved: dict[str, Optional[int]], now: int) -> None:
+    if not resolved:
+        return
+    table = VanityCache.__table__
+    stmt = dialect_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.vanity],
+        set_={"steam_id": stmt.excluded.steam_id, "resolved_ts": stmt.excluded.resolved_ts},
+    )
+    await session.execute(
+        stmt,
+        [{"vanity": name, "steam_id": sid, "resolved_ts": now} for name, sid in resolved.items()],
+    )
+
+
+# -------------------------
+# Shard leases
+# -------------------------
+async def heartbeat_worker(session: AsyncSession, owner: str, expires_ts: int) -> None:
+    stmt = dialect_insert(PollerWorker).values(owner=owner, expires_ts=expires_ts)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PollerWorker.owner],
+        set_={"expires_ts": expires_ts},
+    )
+    await session.execute(stmt)
+
+
+async def list_live_workers(session: AsyncSession, now: int) -> list[str]:
+    stmt = select(PollerWorker.owner).where(PollerWorker.expires_ts > now).order_by(PollerWorker.owner)
+    rows = (await session.execute(stmt)).all()
+    return [r[0] for r in rows]
+
+
+async def remove_worker(session: AsyncSession, owner: str) -> None:
+    await session.execute(delete(PollerWorker).where(PollerWorker.owner == owner))
+
+
+async def prune_workers(session: AsyncSession, before_ts: int) -> None:
+    await session.execute(delete(PollerWorker).where(PollerWorker.expires_ts < before_ts))
+
+
+async def renew_leases(session: AsyncSession, owner: str, now: int, ttl: int) -> None:
+    stmt = (
+        update(ShardLease)
+        .where(ShardLease.owner == owner, ShardLease.expires_ts > now)
+        .values(expires_ts=now + ttl)
+    )
+    await session.execute(stmt)
+
+
+async def list_live_leases(session: AsyncSession, now: int) -> dict[int, str]:
+    """
+    shard -> owner для всех живых (не истёкших) аренд.
+    """
+    stmt = select(ShardLease.shard, ShardLease.owner).where(ShardLease.expires_ts > now)
+    rows = (await session.execute(stmt)).all()
+    return {r[0]: r[1] for r in rows}
+
+
+async def list_owned_shards(session: AsyncSession, owner: str, now: int) -> set[int]:
+    stmt = select(ShardLease.shard).where(ShardLease.owner == owner, ShardLease.expires_ts > now)
+    rows = (await session.execute(stmt)).all()
+    return {r[0] for r in rows}
+
+
+async def claim_shard(session: AsyncSession, shard: int, owner: str, now: int, ttl: int) -> None:
+    """
+    Атомарно забирает шард, если он свободен или его аренда истекла.
+    """
+    stmt = dialect_insert(ShardLease).values(shard=shard, owner=owner, expires_ts=now + ttl)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ShardLease.shard],
+        set_={"owner": owner, "expires_ts": now + ttl},
+        where=ShardLease.expires_ts <= now,
+    )
+    await session.execute(stmt)
+
+
+async def release_shards(session: AsyncSession, owner: str, shards: list[int]) -> None:
+    if not shards:
+        return
+    stmt = (
+        update(ShardLease)
+        .where(ShardLease.owner == owner, ShardLease.shard.in_(shards))
+        .values(expires_ts=0)
+    )
+    await session.execute(stmt)
+
+
+# -------------------------
+# Presence feed (воркеры -> бот)
+# -------------------------
+async def append_presence_updates(session: AsyncSession, rows: list[dict]) -> None:
     """
-    now = int(time.time())
+    rows: [{steam_id, gameid, personaname, personastate, lastlogoff, observed_ts}, ...]
+    """
+    if not rows:
+        return
+    await session.execute(dialect_insert(PresenceUpdate.__table__), rows)
+
+
+async def read_presence_updates(session: AsyncSession, limit: int) -> list[PresenceUpdate]:
+    stmt = select(PresenceUpdate).order_by(PresenceUpdate.id).limit(limit)
+    return list((await session.execute(stmt)).scalars().all())
+
+
+async def delete_presence_updates(session: AsyncSession, ids: list[int]) -> None:
+    if not ids:
+        return
+    await session.execute(delete(PresenceUpdate).where(PresenceUpdate.id.in_(ids)))
+
+
+async def load_presence_latest(session: AsyncSession) -> list[PresenceLatest]:
+    return list((await session.execute(select(PresenceLatest))).scalars().all())
 
-    stmt = select(PlayerState).where(
-        PlayerState.chat_id == chat_id,
-        PlayerState.steam_id == steam_id,
+
+async def upsert_presence_latest(session: AsyncSession, rows: list[dict]) -> None:
+    """
+    rows: [{steam_id, gameid, personaname, personastate, lastlogoff, observed_ts}, ...],
+    не больше одной строки на steam_id.
+    """
+    if not rows:
+        return
+    table = PresenceLatest.__table__
+    stmt = dialect_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.steam_id],
+        set_={
+            "gameid": stmt.excluded.gameid,
+            "personaname": stmt.excluded.personaname,
+            "personastate": stmt.excluded.personastate,
+            "lastlogoff": stmt.excluded.lastlogoff,
+            "observed_ts": stmt.excluded.observed_ts,
+        },
     )
-    state = (await session.execute(stmt)).scalar_one_or_none()
+    await session.execute(stmt, rows)
+
+
+async def prune_presence_latest(session: AsyncSession) -> None:
+    """
+    Убирает наблюдения игроков, которых нет ни в одном чате.
+    """
+    await session.execute(delete(PresenceLatest).where(PresenceLatest.steam_id.not_in(select(Player.steam_id))))
+
 
-    # Если состояния нет — создаём
-    if not state:
-        state = PlayerState(
-            chat_id=chat_id,
-            steam_id=steam_id,
-            was_playing_bf6=int(is_playing_bf6),
-            since_ts=now if is_playing_bf6 else None,
-            last_alert_ts=now if is_playing_bf6 else None,
+# -------------------------
+# Play sessions / stats
+# -------------------------
+async def record_play_sessions(
+    session: AsyncSession,
+    sessions: list[tuple[int, int, int, int, Optional[str]]],
+) -> None:
+    """
+    sessions: [(chat_id, steam_id, started_ts, ended_ts, appid), ...]
+    Дописывает play_sessions и инкрементально обновляет дневные роллапы
+    (сессия целиком относится к дню своего начала; роллапы — по всем играм чата).
+    """
+    if not sessions:
+        return
+
+    await session.execute(
+        dialect_insert(PlaySession.__table__),
+        [
+            {"chat_id": c, "steam_id": s, "started_ts": start, "ended_ts": end, "appid": appid}
+            for c, s, start, end, appid in sessions
+        ],
+    )
+
+    # сначала сворачиваем пачку в памяти: по строке роллапа на (чат, день, игрок)
+    rollups: dict[tuple[int, int, int], list[int]] = {}
+    for chat_id, steam_id, start, end, _ in sessions:
+        dur = max(0, end - start)
+        agg = rollups.setdefault((chat_id, day_key(start), steam_id), [0, 0, 0])
+        agg[0] += dur
+        agg[1] += 1
+        agg[2] = max(agg[2], dur)
+
+    table = PlayStatDaily.__table__
+    stmt = dialect_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.chat_id, table.c.day, table.c.steam_id],
+        set_={
+            "total_sec": table.c.total_sec + stmt.excluded.total_sec,
+            "sessions": table.c.sessions + stmt.excluded.sessions,
+            # max(a, b) без агрегатных функций: одинаково в SQLite и PostgreSQL
+            "longest_sec": case(
+                (stmt.excluded.longest_sec > table.c.longest_sec, stmt.excluded.longest_sec),
+                else_=table.c.longest_sec,
+            ),
+        },
+    )
+    await session.execute(
+        stmt,
+        [
+            {"chat_id": c, "day": d, "steam_id": s, "total_sec": t, "sessions": n, "longest_sec": m}
+            for (c, d, s), (t, n, m) in rollups.items()
+        ],
+    )
+
+
+async def get_play_stats(
+    session: AsyncSession,
+    chat_id: int,
+    since_day: int,
+) -> list[tuple[int, int, int, int]]:
+    """
+    Только роллапы: [(steam_id, total_sec, sessions, longest_sec), ...] за дни >= since_day.
+    """
+    stmt = (
+        select(
+            PlayStatDaily.steam_id,
+            func.sum(PlayStatDaily.total_sec),
+            func.sum(PlayStatDaily.sessions),
+            func.max(PlayStatDaily.longest_sec),
         )
-        session.add(state)
-        return bool(is_playing_bf6)
-
-    # Переход: не играл -> играет
-    if is_playing_bf6 and not state.was_playing_bf6:
-        state.was_playing_bf6 = 1
-        state.since_ts = now
-
-        # антифлуд: если уже алертили недавно, то не алертим снова
-        last_alert = int(state.last_alert_ts) if state.last_alert_ts else 0
-        if now - last_alert >= alert_cooldown_sec:
-            state.last_alert_ts = now
-            return True
-
-        # даже если не алертим — обновим last_alert_ts не нужно
-        return False
-
-    # Всё ещё играет — ничего не меняем
-    if is_playing_bf6 and state.was_playing_bf6:
-        return False
-
-    # Переход: играл -> не играет
-    if (not is_playing_bf6) and state.was_playing_bf6:
-        state.was_playing_bf6 = 0
-        state.since_ts = None
-        return False
-
-    return False
+        .where(PlayStatDaily.chat_id == chat_id, PlayStatDaily.day >= since_day)
+        .group_by(PlayStatDaily.steam_id)
+    )
+    rows = (await session.execute(stmt)).all()
+    return [(r[0], int(r[1] or 0), int(r[2] or 0), int(r[3] or 0)) for r in rows]
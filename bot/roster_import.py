@@ -0,0 +1,213 @@
+"""
+Массовый импорт ростера: текст/CSV со SteamID, ссылками на профили
+или короткими именами (vanity). Имена резолвятся через ResolveVanityURL
+параллельно, с кэшем в БД; все игроки пишутся одной транзакцией.
+"""
+import asyncio
+import csv
+import logging
+import re
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from bot.db import session_scope
+from bot.repo import bulk_add_players, get_cached_vanity, put_cached_vanity, upsert_chat
+from bot.steam import SteamClient, describe_error
+
+logger = logging.getLogger(__name__)
+
+STEAM_ID_RE = re.compile(r"^\d{17}$")
+PROFILE_URL_RE = re.compile(
+    r"^(?:https?://)?(?:www\.)?steamcommunity\.com/(profiles|id)/([^/?#\s]+)/?(?:[?#].*)?$",
+    re.IGNORECASE,
+)
+VANITY_RE = re.compile(r"^[A-Za-z0-9_-]{2,32}$")
+# заголовок CSV пропускаем
+HEADER_TOKENS = {"steamid", "steam_id", "id", "url", "profile"}
+
+REPORT_LIMIT = 3900
+
+STATUS_ICONS = {
+    "added": "✅",
+    "duplicate": "↩️",
+    "not_found": "⚠️",
+    "invalid": "❌",
+    "error": "⏳",
+    "skipped": "✂️",
+}
+STATUS_TEXT = {
+    "duplicate": "повтор",
+    "not_found": "профиль не найден",
+    "invalid": "не SteamID, не ссылка и не имя профиля",
+    "error": "Steam не ответил, повторите позже",
+    "skipped": "сверх лимита строк",
+}
+
+
+@dataclass
+class ImportRow:
+    line: int
+    raw: str
+    name: Optional[str] = None
+    vanity: Optional[str] = None
+    steam_id: Optional[int] = None
+    status: str = ""
+
+
+def _split_line(line: str) -> tuple[str, Optional[str]]:
+    # CSV (',', ';' или таб) — через csv ради кавычек; иначе «<id> [имя]», как у /addsteam
+    for delim in (",", ";", "\t"):
+        if delim in line:
+            fields = [f.strip() for f in next(csv.reader([line], delimiter=delim))]
+            return fields[0], (fields[1] if len(fields) > 1 and fields[1] else None)
+    parts = line.split(maxsplit=1)
+    return parts[0], (parts[1].strip() if len(parts) > 1 else None)
+
+
+def parse_roster(text: str) -> list[ImportRow]:
+    """
+    Строка -> ImportRow: steam_id уже известен (17 цифр или /profiles/<id>),
+    vanity — имя, которое надо резолвить, или status="invalid".
+    """
+    rows: list[ImportRow] = []
+    for num, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        token, name = _split_line(line)
+        if not rows and token.lower() in HEADER_TOKENS:
+            continue
+
+        row = ImportRow(line=num, raw=token, name=name)
+        url = PROFILE_URL_RE.match(token)
+        if STEAM_ID_RE.match(token):
+            row.steam_id = int(token)
+        elif url and url.group(1).lower() == "profiles":
+            if STEAM_ID_RE.match(url.group(2)):
+                row.steam_id = int(url.group(2))
+            else:
+                row.status = "invalid"
+        elif url and VANITY_RE.match(url.group(2)):
+            row.vanity = url.group(2).lower()
+        elif not url and VANITY_RE.match(token):
+            row.vanity = token.lower()
+        else:
+            row.status = "invalid"
+        rows.append(row)
+    return rows
+
+
+class RosterImporter:
+    """
+    /importsteam: разбор, резолв vanity (кэш в vanity_cache на cache_ttl
+    секунд, промахи — параллельно, темп и квоты держит SteamClient)
+    и один executemany в players.
+    """
+
+    def __init__(self, steam: SteamClient, cache_ttl: int, max_rows: int = 500) -> None:
+        self.steam = steam
+        self.cache_ttl = cache_ttl
+        self.max_rows = max_rows
+
+    async def run(self, chat_id: int, text: str) -> list[ImportRow]:
+        rows = parse_roster(text)
+        for row in rows[self.max_rows :]:
+            row.status = "skipped"
+        work = [r for r in rows[: self.max_rows] if not r.status]
+
+        await self._resolve([r for r in work if r.vanity])
+
+        seen: set[int] = set()
+        players: list[tuple[int, Optional[str]]] = []
+        for row in work:
+            if row.status:
+                continue
+            if row.steam_id is None or not STEAM_ID_RE.match(str(row.steam_id)):
+                row.status = "not_found" if row.vanity else "invalid"
+            elif row.steam_id in seen:
+                row.status = "duplicate"
+            else:
+                seen.add(row.steam_id)
+                row.status = "added"
+                players.append((row.steam_id, row.name))
+
+        async with session_scope() as session:
+            await upsert_chat(session, chat_id)
+            await bulk_add_players(session, chat_id, players)
+            await session.commit()
+        logger.info("Roster import in chat %s: %d rows, %d players", chat_id, len(rows), len(players))
+        return rows
+
+    async def _resolve(self, rows: list[ImportRow]) -> None:
+        names = sorted({r.vanity for r in rows})
+        if not names:
+            return
+        now = int(time.time())
+        async with session_scope() as session:
+            known = await get_cached_vanity(session, names, now - self.cache_ttl)
+            await session.commit()
+
+        missing = [n for n in names if n not in known]
+        results = await asyncio.gather(*(self.steam.resolve_vanity(n) for n in missing), return_exceptions=True)
+        resolved: dict[str, Optional[int]] = {}
+        failed: set[str] = set()
+        for name, res in zip(missing, results):
+            if isinstance(res, BaseException):
+                if not isinstance(res, Exception):
+                    raise res
+                failed.add(name)
+                logger.warning("ResolveVanityURL %r failed: %s", name, describe_error(res))
+            else:
+                resolved[name] = res
+
+        if resolved:
+            async with session_scope() as session:
+                await put_cached_vanity(session, resolved, now)
+                await session.commit()
+
+        known.update(resolved)
+        for row in rows:
+            if row.vanity in failed:
+                row.status = "error"
+            else:
+                row.steam_id = known.get(row.vanity)
+
+
+def render_report(rows: list[ImportRow]) -> str:
+    if not rows:
+        return "Нечего импортировать: ни одной строки со SteamID, ссылкой или именем профиля."
+
+    counts: dict[str, int] = {}
+    for row in rows:
+        counts[row.status] = counts.get(row.status, 0) + 1
+
+    head = [
+        "📥 Импорт: добавлено / обновлено {}, повторов {}, не найдено {}, ошибок формата {}".format(
+            counts.get("added", 0),
+            counts.get("duplicate", 0),
+            counts.get("not_found", 0),
+            counts.get("invalid", 0),
+        )
+    ]
+    if counts.get("error"):
+        head.append(f"⏳ Steam не ответил для {counts['error']} имён — повторите импорт позже.")
+    if counts.get("skipped"):
+        head.append(f"✂️ Пропущено {counts['skipped']} строк сверх лимита.")
+
+    lines: list[str] = []
+    size = sum(len(h) + 1 for h in head)
+    for i, row in enumerate(rows):
+        if row.status == "added":
+            detail = f"{row.raw} → {row.steam_id}" if row.vanity else str(row.steam_id)
+            if row.name:
+                detail += f" ({row.name})"
+        else:
+            detail = f"{row.raw} — {STATUS_TEXT.get(row.status, row.status)}"
+        line = f"{STATUS_ICONS.get(row.status, '•')} {row.line}: {detail}"
+        if size + len(line) + 1 > REPORT_LIMIT:
+            lines.append(f"… и ещё {len(rows) - i} строк")
+            break
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(head + [""] + lines)
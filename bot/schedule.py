@@ -0,0 +1,142 @@
+import heapq
+from typing import Iterable, Optional
+
+from bot.steam import STEAM_BATCH_SIZE
+
+
+class PollScheduler:
+    """
+    Адаптивное расписание опроса: у каждого steam_id своё время next-due.
+
+    Интервал выбирается по последнему summary:
+      - онлайн, но не в отслеживаемой игре — быстрее всех (вот-вот может зайти);
+      - в отслеживаемой игре — средне (ловим выход);
+      - офлайн недавно — базовый интервал;
+      - давно офлайн / профиль недоступен — реже всех.
+
+    Очередь — heap из (due, steam_id) с ленивым удалением устаревших записей.
+    """
+
+    def __init__(
+        self,
+        online_sec: int,
+        ingame_sec: int,
+        offline_sec: int,
+        long_offline_sec: int,
+        long_offline_after: int,
+        appids: Iterable[str],
+    ) -> None:
+        self.online_sec = online_sec
+        self.ingame_sec = ingame_sec
+        self.offline_sec = offline_sec
+        self.long_offline_sec = long_offline_sec
+        self.long_offline_after = long_offline_after
+        # все appid, которые смотрит хоть один чат
+        self.appids = {str(a) for a in appids}
+
+        # множитель интервалов: > 1, когда дневного бюджета Steam не хватает
+        self.pace = 1.0
+
+        self._due: dict[int, float] = {}
+        self._heap: list[tuple[float, int]] = []
+
+    def __contains__(self, steam_id: int) -> bool:
+        return steam_id in self._due
+
+    def sync(self, steam_ids: Iterable[int], now: float) -> None:
+        """
+        Приводит расписание к актуальному набору id: новые — сразу в работу,
+        пропавшие — забываем.
+        """
+        wanted = set(steam_ids)
+        for sid in list(self._due):
+            if sid not in wanted:
+                del self._due[sid]
+        for sid in wanted:
+            if sid not in self._due:
+                self._set(sid, now)
+
+    def _set(self, steam_id: int, due: float) -> None:
+        self._due[steam_id] = due
+        heapq.heappush(self._heap, (due, steam_id))
+
+    def _pop_valid(self) -> Optional[tuple[float, int]]:
+        while self._heap:
+            due, sid = heapq.heappop(self._heap)
+            if self._due.get(sid) == due:
+                return due, sid
+        return None
+
+    def next_due(self) -> Optional[float]:
+        while self._heap:
+            due, sid = self._heap[0]
+            if self._due.get(sid) == due:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+    def take_due(self, now: float, batch_size: int = STEAM_BATCH_SIZE) -> list[int]:
+        """
+        Забирает все id, чьё время пришло, и добивает последний батч
+        ближайшими по времени до полных batch_size — лишние id в том же
+        запросе к Steam ничего не стоят.
+        """
+        taken: list[int] = []
+        while True:
+            due = self.next_due()
+            if due is None or due > now:
+                break
+            taken.append(self._pop_valid()[1])
+
+        if taken:
+            while len(taken) % batch_size:
+                item = self._pop_valid()
+                if item is None:
+                    break
+                taken.append(item[1])
+
+        # до reschedule id считаются «в работе»
+        for sid in taken:
+            self._due[sid] = float("inf")
+        return taken
+
+    def snapshot(self) -> dict[int, float]:
+        """
+        steam_id -> due (unix ts) для снапшота поллера; id «в работе» не сохраняем.
+        """
+        return {sid: due for sid, due in self._due.items() if due != float("inf")}
+
+    def restore(self, dues: dict[int, float]) -> None:
+        """
+        Поднимает расписание из снапшота (до первого sync).
+        """
+        for sid, due in dues.items():
+            self._set(int(sid), float(due))
+
+    def requeue(self, steam_ids: Iterable[int], due: float) -> None:
+        """
+        Возвращает в очередь id, опрос которых не удался.
+        """
+        for sid in steam_ids:
+            if sid in self._due:
+                self._set(sid, due)
+
+    def interval_for(self, summary: Optional[dict], now: float) -> int:
+        if not summary:
+            return self.long_offline_sec
+
+        if str(summary.get("gameid")) in self.appids:
+            return self.ingame_sec
+
+        if int(summary.get("personastate") or 0) > 0:
+            return self.online_sec
+
+        lastlogoff = int(summary.get("lastlogoff") or 0)
+        if lastlogoff and now - lastlogoff >= self.long_offline_after:
+            return self.long_offline_sec
+        return self.offline_sec
+
+    def reschedule(self, steam_id: int, summary: Optional[dict], now: float) -> None:
+        if steam_id not in self._due:
+            return  # id успели убрать из ростера
+        self._set(steam_id, now + self.interval_for(summary, now) * self.pace)
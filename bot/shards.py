@@ -0,0 +1,95 @@
+import logging
+import math
+import time
+import zlib
+
+from bot.db import session_scope
+from bot.repo import (
+    claim_shard,
+    heartbeat_worker,
+    list_live_leases,
+    list_live_workers,
+    list_owned_shards,
+    prune_workers,
+    release_shards,
+    remove_worker,
+    renew_leases,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(steam_id: int, num_shards: int) -> int:
+    """
+    Стабильный (между процессами и перезапусками) номер шарда для steam_id.
+    """
+    # по десятичной записи — как и до перехода steam_id на int, шарды не переезжают
+    return zlib.crc32(str(steam_id).encode("ascii")) % num_shards
+
+
+class LeaseManager:
+    """
+    Раздаёт фиксированное число шардов между живыми воркерами через
+    таблицу shard_leases.
+
+    Каждый воркер раз в ttl/3 секунд шлёт heartbeat в poller_workers,
+    продлевает свои аренды и добирает свободные/истёкшие шарды до
+    справедливой доли ceil(shards / живые воркеры).
+    Если воркер умер, его аренды истекают и разбираются остальными;
+    если пришёл новый — «лишние» шарды отпускаются и переезжают к нему.
+    """
+
+    def __init__(self, owner: str, num_shards: int, ttl: int) -> None:
+        self.owner = owner
+        self.num_shards = num_shards
+        self.ttl = ttl
+        self.shards: set[int] = set()
+
+    async def rebalance(self) -> set[int]:
+        now = int(time.time())
+
+        async with session_scope() as session:
+            await heartbeat_worker(session, self.owner, now + self.ttl)
+            # давно умершие воркеры (kill -9) не должны копиться
+            await prune_workers(session, now - 10 * self.ttl)
+            await renew_leases(session, self.owner, now, self.ttl)
+            workers = set(await list_live_workers(session, now)) | {self.owner}
+            live = await list_live_leases(session, now)
+
+            fair = math.ceil(self.num_shards / len(workers))
+            mine = sorted(s for s, o in live.items() if o == self.owner)
+
+            if len(mine) < fair:
+                # добираем свободные/истёкшие шарды до справедливой доли;
+                # гонку с другими воркерами решает условный upsert
+                free = [s for s in range(self.num_shards) if s not in live]
+                for shard in free[: fair - len(mine)]:
+                    await claim_shard(session, shard, self.owner, now, self.ttl)
+            elif len(mine) > fair:
+                # отдаём лишнее новым воркерам
+                await release_shards(session, self.owner, mine[fair:])
+
+            await session.flush()
+            shards = await list_owned_shards(session, self.owner, now)
+            await session.commit()
+
+        if shards != self.shards:
+            logger.info(
+                "Worker %s owns %d/%d shards (%d workers)",
+                self.owner,
+                len(shards),
+                self.num_shards,
+                len(workers),
+            )
+        self.shards = shards
+        return self.shards
+
+    async def release_all(self) -> None:
+        async with session_scope() as session:
+            await release_shards(session, self.owner, sorted(self.shards))
+            await remove_worker(session, self.owner)
+            await session.commit()
+        self.shards = set()
+
+    def owns(self, steam_id: int) -> bool:
+        return shard_of(steam_id, self.num_shards) in self.shards
@@ -0,0 +1,80 @@
+"""
+Снапшот поллера для тёплого старта: расписание опроса (due по каждому
+steam_id), последние обработанные поля summary каждого игрока
+(только SUMMARY_FIELDS) и отпечатки страниц панелей.
+
+Пишется при остановке бота и читается при старте, после чего файл
+удаляется: после падения старый снапшот не должен подсовывать
+устаревшие отпечатки панелей.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+from bot.panel import PanelTracker
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 4
+
+
+def _write(path: str, data: dict) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def _read(path: str) -> Optional[dict]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    finally:
+        # одноразовый: следующий старт без нового снапшота будет холодным
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    if data.get("version") != SNAPSHOT_VERSION:
+        return None
+    return data
+
+
+async def save_snapshot(path: str, source, panels: PanelTracker) -> None:
+    if not path:
+        return
+    data = {
+        "version": SNAPSHOT_VERSION,
+        "saved_ts": int(time.time()),
+        "source": source.snapshot(),
+        "panels": panels.snapshot(),
+    }
+    await asyncio.to_thread(_write, path, data)
+    logger.info("Poller snapshot saved to %s", path)
+
+
+async def load_snapshot(path: str, source, panels: PanelTracker) -> bool:
+    """
+    Восстанавливает source и panels из снапшота. False — снапшота нет
+    (или он битый/другой версии), старт будет холодным.
+    """
+    if not path:
+        return False
+    try:
+        data = await asyncio.to_thread(_read, path)
+    except Exception:
+        logger.exception("Failed to read poller snapshot %s", path)
+        return False
+    if data is None:
+        return False
+
+    source.restore(data.get("source", {}))
+    panels.restore(data.get("panels", {}))
+    logger.info("Poller snapshot loaded (saved %ds ago)", int(time.time()) - int(data.get("saved_ts", 0)))
+    return True
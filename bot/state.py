@@ -0,0 +1,151 @@
+import asyncio
+import logging
+from typing import Optional
+
+from bot import metrics, trace
+from bot.db import session_scope
+from bot.events import EventBus
+from bot.presence import PresenceState, apply_presence
+from bot.repo import bulk_upsert_states, load_tracked, record_play_sessions
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore:
+    """
+    Авторитетное состояние игроков в памяти процесса.
+
+    Поллер — единственный писатель player_states, поэтому перечитывать
+    таблицу каждый тик незачем: состояние один раз поднимается из БД
+    при старте, а изменённые записи (dirty) сбрасываются в SQLite
+    пачками по таймеру и при остановке бота.
+
+    Каждый старт и стоп сессии публикуется в bus (лента /events), если она есть.
+    """
+
+    def __init__(self, bus: Optional[EventBus] = None) -> None:
+        self.bus = bus
+        self._states: dict[int, dict[int, PresenceState]] = {}
+        self._dirty: set[tuple[int, int]] = set()
+        # завершённые сессии (chat_id, steam_id, started_ts, ended_ts, appid) до следующего flush
+        self._sessions: list[tuple[int, int, int, int, Optional[str]]] = []
+        self._flush_lock = asyncio.Lock()
+
+    async def hydrate(self) -> None:
+        async with session_scope() as session:
+            _, states = await load_tracked(session)
+            await session.commit()
+        self._states = states
+        self._dirty.clear()
+        logger.info("State store hydrated: %d chats", len(states))
+
+    def chat_states(self, chat_id: int) -> dict[int, PresenceState]:
+        """
+        steam_id -> PresenceState для чата (живой dict, не копия).
+        """
+        return self._states.get(chat_id, {})
+
+    def apply(
+        self,
+        chat_id: int,
+        steam_id: int,
+        appid: Optional[str],
+        now: int,
+        name: Optional[str] = None,
+    ) -> tuple[bool, bool]:
+        """
+        Применяет наблюдение и помечает запись грязной, если она поменялась.
+        appid — отслеживаемая чатом игра, в которую игрок сейчас играет, или None.
+        Смена одной игры на другую закрывает сессию в прежней.
+        name — имя игрока для ленты событий.
+        Возвращает (should_alert, changed).
+        """
+        state = self._states.setdefault(chat_id, {}).setdefault(steam_id, PresenceState())
+        started = state.since_ts if state.was_playing_bf6 else None
+        prev_appid = state.appid
+        should_alert, changed = apply_presence(state, appid, now)
+        if changed:
+            self._dirty.add((chat_id, steam_id))
+            stopped = started and (not state.was_playing_bf6 or state.appid != prev_appid)
+            if stopped:
+                self._sessions.append((chat_id, steam_id, int(started), now, prev_appid))
+            if self.bus is not None:
+                self._publish(chat_id, steam_id, state, name, now, started if stopped else None, prev_appid, should_alert)
+        return should_alert, changed
+
+    def _publish(
+        self,
+        chat_id: int,
+        steam_id: int,
+        state: PresenceState,
+        name: Optional[str],
+        now: int,
+        stopped_since: Optional[int],
+        prev_appid: Optional[str],
+        alerted: bool,
+    ) -> None:
+        # steam_id строкой: 64-битные id не влезают в double у JS-клиентов
+        base = {"chat_id": chat_id, "steam_id": str(steam_id), "name": name, "ts": now}
+        if stopped_since:
+            self.bus.publish(
+                chat_id,
+                {"type": "stop", **base, "appid": prev_appid, "started_ts": int(stopped_since), "ended_ts": now},
+            )
+        if state.was_playing_bf6 and state.since_ts == now:
+            self.bus.publish(
+                chat_id,
+                {"type": "start", **base, "appid": state.appid, "since_ts": now, "alert": alerted},
+            )
+
+    @property
+    def dirty_count(self) -> int:
+        return len(self._dirty)
+
+    async def flush(self) -> int:
+        """
+        Пишет все грязные записи и завершённые сессии одной транзакцией.
+        Возвращает число строк состояний.
+        """
+        async with self._flush_lock:
+            if not self._dirty and not self._sessions:
+                return 0
+
+            keys, self._dirty = self._dirty, set()
+            sessions, self._sessions = self._sessions, []
+            rows = []
+            for chat_id, steam_id in keys:
+                st = self._states[chat_id][steam_id]
+                rows.append(
+                    {
+                        "chat_id": chat_id,
+                        "steam_id": steam_id,
+                        "was_playing_bf6": st.was_playing_bf6,
+                        "since_ts": st.since_ts,
+                        "last_alert_ts": st.last_alert_ts,
+                        "appid": st.appid,
+                    }
+                )
+
+            try:
+                with metrics.POLL_STAGE_SECONDS.time("state_flush"), trace.span("state_flush", rows=len(rows)):
+                    async with session_scope() as session:
+                        await bulk_upsert_states(session, rows)
+                        await record_play_sessions(session, sessions)
+                        await session.commit()
+            except Exception:
+                # не потерять изменения: вернём ключи в dirty до следующей попытки
+                self._dirty |= keys
+                self._sessions[:0] = sessions
+                raise
+
+            metrics.STATE_FLUSH_ROWS.inc(amount=len(rows))
+            return len(rows)
+
+
+async def flush_loop(store: StateStore, interval: int) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await store.flush()
+        except Exception:
+            logger.exception("State flush error")
@@ -0,0 +1,103 @@
+"""
+Статистика игровых сессий: ключи дневных роллапов, разбор периода
+для /stats и рендер ответа. Сами роллапы — в repo.record_play_sessions.
+"""
+from __future__ import annotations
+
+import re
+import time
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from bot.fmt import fmt_duration
+from bot.panel import panel_header
+
+DEFAULT_PERIOD = "week"
+PERIODS = {"today": 1, "day": 1, "week": 7, "month": 30, "all": 0}
+_DAYS_RE = re.compile(r"^(\d{1,4})d$")
+
+PERIOD_TITLES = {1: "сегодня", 7: "7 дней", 30: "30 дней", 0: "всё время"}
+
+
+def day_key(ts: int) -> int:
+    """
+    unix ts -> YYYYMMDD по локальному времени (TZ контейнера).
+    """
+    d = datetime.fromtimestamp(ts)
+    return d.year * 10000 + d.month * 100 + d.day
+
+
+def parse_period(arg: Optional[str]) -> Optional[int]:
+    """
+    'today' | 'week' | 'month' | 'all' | '<N>d' -> число дней (0 — всё время).
+    None, если аргумент не распознан.
+    """
+    arg = (arg or DEFAULT_PERIOD).strip().lower()
+    if arg in PERIODS:
+        return PERIODS[arg]
+    m = _DAYS_RE.match(arg)
+    if m and int(m.group(1)) > 0:
+        return int(m.group(1))
+    return None
+
+
+def period_start(days: int, now_ts: Optional[int] = None) -> int:
+    """
+    Полночь (локальная) первого дня периода, unix ts; 0 — без ограничения.
+    """
+    if days <= 0:
+        return 0
+    today = date.fromtimestamp(now_ts if now_ts is not None else int(time.time()))
+    start = today - timedelta(days=days - 1)
+    return int(datetime(start.year, start.month, start.day).timestamp())
+
+
+def live_seconds(states: dict[int, object], start_ts: int, now_ts: int) -> dict[int, int]:
+    """
+    Идущие сейчас сессии, обрезанные началом периода: steam_id -> секунды.
+    """
+    live: dict[int, int] = {}
+    for steam_id, st in states.items():
+        since_ts = getattr(st, "since_ts", None)
+        if getattr(st, "was_playing_bf6", 0) and since_ts:
+            live[steam_id] = max(0, now_ts - max(int(since_ts), start_ts))
+    return live
+
+
+def render_stats(
+    days: int,
+    rows: list[tuple[int, int, int, int]],
+    names: dict[int, Optional[str]],
+    live: dict[int, int],
+    games: Optional[dict[str, str]] = None,
+) -> str:
+    """
+    rows — (steam_id, total_sec, sessions, longest_sec) из роллапов;
+    live — steam_id -> секунды идущей сейчас сессии (в сумму, не в счётчики);
+    games — игры чата для заголовка (время суммируется по всем).
+    """
+    totals: dict[int, list[int]] = {sid: [total, n, longest] for sid, total, n, longest in rows}
+    for sid, sec in live.items():
+        agg = totals.setdefault(sid, [0, 0, 0])
+        agg[0] += sec
+
+    title = PERIOD_TITLES.get(days, f"{days} дн.")
+    lines = [f"{panel_header(games, '📊')} — {title}"]
+    if not totals:
+        lines.append("Пока никто не играл.")
+        return "\n".join(lines)
+
+    ordered = sorted(totals.items(), key=lambda kv: kv[1][0], reverse=True)
+    for i, (sid, (total, n, longest)) in enumerate(ordered, 1):
+        label = (names.get(sid) or str(sid)).strip()
+        line = f"{i}. {label} — {fmt_duration(total)}"
+        if n:
+            line += f", сессий: {n}, макс. {fmt_duration(longest)}"
+        if sid in live:
+            line += " 🟢"
+        lines.append(line)
+
+    text = "\n".join(lines)
+    if len(text) > 3900:
+        text = text[:3900] + "\n…"
+    return text
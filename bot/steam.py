@@ -1,29 +1,279 @@
-from typing import Iterable
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Container, Iterable, Optional, Sequence, Union
 
 import aiohttp
 
-STEAM_SUMMARIES_URL = "https://api.steampowered.com/ISteamUser/GetPlayerSummaries/v2/"
+from bot import metrics
+from bot.quota import CircuitBreaker, KeyPool, SteamUnavailable
 
+logger = logging.getLogger(__name__)
 
-async def get_player_summaries(
-    api_key: str,
-    steam_ids: Iterable[str],
-) -> dict[str, dict]:
+STEAM_API_BASE = "https://api.steampowered.com"
+STEAM_SUMMARIES_PATH = "/ISteamUser/GetPlayerSummaries/v2/"
+STEAM_VANITY_PATH = "/ISteamUser/ResolveVanityURL/v1/"
+STEAM_BATCH_SIZE = 100
+
+# сколько отдыхает ключ, если Steam не прислал Retry-After
+COOLDOWN_429_SEC = 60.0
+COOLDOWN_403_SEC = 3600.0
+
+# единственные поля summary, которые читают поллер, расписание и воркер
+# (сам steamid — ключ словаря, числом)
+SUMMARY_FIELDS = ("gameid", "personaname", "personastate", "lastlogoff")
+
+
+def _chunks(items: list[int], size: int) -> list[list[int]]:
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def _retryable(exc: BaseException) -> bool:
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status in (403, 429) or exc.status >= 500
+    return isinstance(exc, (asyncio.TimeoutError, aiohttp.ClientError))
+
+
+def describe_error(exc: BaseException) -> str:
+    # str(ClientResponseError) содержит URL запроса, а в нём — ключ API
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return f"HTTP {exc.status}"
+    return str(exc) or type(exc).__name__
+
+
+def _retry_after(resp: aiohttp.ClientResponse, default: float) -> float:
+    try:
+        return max(1.0, float(resp.headers.get("Retry-After", "")))
+    except ValueError:
+        return default
+
+
+# id ещё не опрашивали (отличается от None — «профиль пропал из ответа»)
+_UNSEEN = object()
+
+
+def record_key(record: Optional[dict]) -> Optional[tuple]:
+    """
+    Значения SUMMARY_FIELDS кортежем — по нему сравнивается «изменилась ли запись».
+    """
+    if record is None:
+        return None
+    return tuple(map(record.get, SUMMARY_FIELDS))
+
+
+def decode_summaries(raw: bytes) -> dict[int, dict]:
+    """
+    Ответ GetPlayerSummaries -> steam_id (int) -> запись игрока как есть.
+    Записи живут один батч и нигде не копятся, так что отбрасывать
+    лишние поля — только тратить время; читаются лишь SUMMARY_FIELDS.
     """
-    Возвращает dict: steam_id -> player_data
+    players = json.loads(raw).get("response", {}).get("players", [])
+    return {int(p["steamid"]): p for p in players}
+
+
+class SteamClient:
+    """
+    Долгоживущий клиент Steam Web API.
+
+    Одна aiohttp-сессия на всё время жизни бота (keep-alive + DNS-кэш),
+    батчи уходят параллельно под семафором. Ключей может быть несколько
+    (KeyPool): у каждого свой темп и дневной лимит, ключ после 429/403
+    отдыхает. Неудачный батч повторяется с экспоненциальной паузой
+    (full jitter), а серия неудач подряд открывает circuit breaker.
+
+    Для каждого steam_id помним SUMMARY_FIELDS последней обработанной
+    записи: id, чья запись с тех пор не изменилась, не считаются
+    изменившимися (расчёт переходов их пропускает). Запоминает вызывающий
+    (mark_seen) — после того, как изменение обработано, а не при загрузке.
     """
-    if not steam_ids:
-        return {}
 
-    params = {
-        "key": api_key,
-        "steamids": ",".join(steam_ids),
-    }
+    def __init__(
+        self,
+        api_key: Union[str, Sequence[str]],
+        concurrency: int = 4,
+        rate_per_sec: float = 5.0,
+        timeout: float = 10.0,
+        base_url: str = STEAM_API_BASE,
+        daily_limit: int = 100000,
+        retries: int = 3,
+        backoff_base: float = 0.5,
+        breaker_threshold: int = 5,
+        breaker_reset: float = 60.0,
+    ) -> None:
+        keys = api_key.split(",") if isinstance(api_key, str) else list(api_key)
+        # rate_per_sec и daily_limit — на каждый ключ
+        self.keys = KeyPool([k.strip() for k in keys], rate_per_sec, daily_limit)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.retries = max(0, retries)
+        self.backoff_base = backoff_base
+        self.base_url = base_url.rstrip("/")
+        self._concurrency = max(1, concurrency)
+        self._sem = asyncio.Semaphore(self._concurrency)
+        self._timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+        # steam_id -> record_key последней обработанной записи
+        self._seen: dict[int, Optional[tuple]] = {}
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._concurrency,
+                ttl_dns_cache=300,
+                keepalive_timeout=60,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self._timeout)
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def mark_seen(self, steam_ids: Iterable[int], summaries: dict[int, dict]) -> None:
+        """
+        Изменения этих id обработаны: следующий опрос сравнивается с ними.
+        """
+        seen = self._seen
+        for sid in steam_ids:
+            seen[sid] = record_key(summaries.get(sid))
+
+    def retain_seen(self, keep: Container[int]) -> None:
+        """
+        Забывает записи игроков, которых больше никто не отслеживает.
+        """
+        for sid in [sid for sid in self._seen if sid not in keep]:
+            del self._seen[sid]
+
+    def export_seen(self) -> dict[str, Optional[list]]:
+        """
+        Последние обработанные записи для снапшота: steam_id -> SUMMARY_FIELDS.
+        """
+        return {str(sid): list(key) if key is not None else None for sid, key in self._seen.items()}
+
+    def import_seen(self, data: dict[str, Optional[list]]) -> None:
+        for sid, key in data.items():
+            self._seen[int(sid)] = tuple(key) if key is not None else None
+
+    async def _request(self, path: str, params: dict[str, str]) -> bytes:
+        """
+        Один HTTP-запрос с ключом из пула. 429/403 отправляют ключ отдыхать.
+        """
+        url = self.base_url + path
+        async with self._sem:
+            key = await self.keys.acquire()
+            metrics.STEAM_KEY_CALLS.inc(key.name)
+            t0 = time.perf_counter()
+            try:
+                async with self._get_session().get(url, params={"key": key.key, **params}) as resp:
+                    if resp.status == 429:
+                        self.keys.cool_down(key, _retry_after(resp, COOLDOWN_429_SEC))
+                    elif resp.status == 403:
+                        self.keys.cool_down(key, _retry_after(resp, COOLDOWN_403_SEC))
+                    resp.raise_for_status()
+                    return await resp.read()
+            except aiohttp.ClientResponseError as e:
+                metrics.STEAM_ERRORS.inc(f"http_{e.status}")
+                raise
+            except asyncio.TimeoutError:
+                metrics.STEAM_ERRORS.inc("timeout")
+                raise
+            except aiohttp.ClientError:
+                metrics.STEAM_ERRORS.inc("network")
+                raise
+            finally:
+                self.keys.release(key)
+                if path == STEAM_SUMMARIES_PATH:
+                    metrics.STEAM_BATCH_SECONDS.observe(time.perf_counter() - t0)
+
+    async def _call(self, path: str, params: dict[str, str]) -> bytes:
+        """
+        Запрос с повторами (full jitter) под circuit breaker.
+        """
+        self.breaker.check()
+        attempt = 0
+        while True:
+            try:
+                raw = await self._request(path, params)
+                break
+            except SteamUnavailable:
+                self.breaker.abort()
+                raise
+            except Exception as e:
+                if not _retryable(e):
+                    # Steam ответил (400/401...) — сам сервис жив
+                    self.breaker.success()
+                    raise
+                if attempt >= self.retries:
+                    self.breaker.failure()
+                    raise
+                # full jitter: не синхронизируем повторы параллельных батчей
+                await asyncio.sleep(random.uniform(0, self.backoff_base * 2**attempt))
+                attempt += 1
+                metrics.STEAM_RETRIES.inc()
+        self.breaker.success()
+        return raw
+
+    async def resolve_vanity(self, name: str) -> Optional[int]:
+        """
+        ResolveVanityURL: короткое имя профиля (steamcommunity.com/id/<name>) -> SteamID64.
+        None — такого профиля нет.
+        """
+        raw = await self._call(STEAM_VANITY_PATH, {"vanityurl": name})
+        response = json.loads(raw).get("response", {})
+        if response.get("success") != 1 or not response.get("steamid"):
+            return None
+        return int(response["steamid"])
+
+    async def fetch_batch(self, steam_ids: list[int]) -> tuple[dict[int, dict], list[int]]:
+        """
+        Возвращает (summaries, changed): changed — id, чья запись
+        отличается от последней обработанной (или пропала из ответа).
+        Сами изменения не запоминаются — это mark_seen.
+        """
+        if not steam_ids:
+            return {}, []
+
+        raw = await self._call(STEAM_SUMMARIES_PATH, {"steamids": ",".join(map(str, steam_ids))})
+        metrics.STEAM_IDS_FETCHED.inc(amount=len(steam_ids))
+
+        summaries = decode_summaries(raw)
+        seen = self._seen
+        changed = [sid for sid in steam_ids if seen.get(sid, _UNSEEN) != record_key(summaries.get(sid))]
+        if not changed:
+            metrics.STEAM_BATCHES_UNCHANGED.inc()
+        return summaries, changed
+
+    async def fetch_changes(self, steam_ids: list[int]) -> tuple[dict[int, dict], list[int], list[int]]:
+        """
+        Полный проход: батчи по 100 параллельно (не больше concurrency
+        одновременно). Кроме summaries возвращает id с изменившимися
+        записями — остальные можно не прогонять через расчёт переходов.
+
+        Неудачный батч не роняет весь проход: его id возвращаются третьим
+        элементом (failed). Исключение — только если не удался ни один батч.
+        """
+        batches = _chunks(steam_ids, STEAM_BATCH_SIZE)
+        results = await asyncio.gather(*(self.fetch_batch(b) for b in batches), return_exceptions=True)
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(STEAM_SUMMARIES_URL, params=params, timeout=10) as resp:
-            resp.raise_for_status()
-            data = await resp.json()
+        summaries: dict[int, dict] = {}
+        changed: list[int] = []
+        failed: list[int] = []
+        error: Optional[BaseException] = None
+        for batch, res in zip(batches, results):
+            if isinstance(res, BaseException):
+                if isinstance(res, asyncio.CancelledError):
+                    raise res
+                error = res
+                failed.extend(batch)
+                continue
+            part, part_changed = res
+            summaries.update(part)
+            changed.extend(part_changed)
 
-    players = data.get("response", {}).get("players", [])
-    return {p["steamid"]: p for p in players}
+        if error is not None:
+            if len(failed) == len(steam_ids):
+                raise error
+            logger.warning("Steam: %d of %d ids failed this pass: %s", len(failed), len(steam_ids), describe_error(error))
+        return summaries, changed, failed
@@ -0,0 +1,158 @@
+"""
+Трассировка тиков поллера и отправок в Telegram.
+
+Спан — одна операция (стадия тика, батч Steam, рендер панели чата,
+вызов Bot API) с длительностью и исходом. Медленные спаны (дольше
+TRACE_SLOW_MS) и спаны с ошибкой пишутся строкой JSON в ротируемый файл
+TRACE_PATH; номер тика связывает спаны одного прохода.
+
+Как и метрики, трассировщик — модульный синглтон: configure() при старте,
+span() где угодно. Пока TRACE_PATH пуст, span() отдаёт один и тот же
+пустой контекст — ни замеров, ни записи.
+"""
+import contextvars
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import time
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from typing import Any, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+_tick_id: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("trace_tick", default=None)
+_ticks = itertools.count(1)
+
+
+class Span:
+    __slots__ = ("stage", "fields", "outcome", "error")
+
+    def __init__(self, stage: str, fields: dict[str, Any]) -> None:
+        self.stage = stage
+        self.fields = fields
+        self.outcome = "ok"
+        self.error: Optional[str] = None
+
+    def fail(self, exc: BaseException, outcome: str = "error") -> None:
+        """
+        Исход для исключения, которое вызывающий код перехватил сам.
+        """
+        self.outcome = outcome
+        self.error = f"{type(exc).__name__}: {exc}"[:500]
+
+    def set(self, **fields: Any) -> None:
+        self.fields.update(fields)
+
+
+class _NoopSpan(Span):
+    def fail(self, exc: BaseException, outcome: str = "error") -> None:
+        pass
+
+    def set(self, **fields: Any) -> None:
+        pass
+
+
+_NOOP = _NoopSpan("", {})
+_NOOP_CM = nullcontext(_NOOP)
+
+
+class Tracer:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.slow_sec = 1.0
+        self._out: Optional[logging.Logger] = None
+
+    def configure(self, path: str, slow_ms: float = 1000.0, max_mb: float = 10.0, backups: int = 3) -> None:
+        if not path:
+            self.enabled = False
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            path,
+            maxBytes=int(max_mb * 2**20),
+            backupCount=backups,
+            encoding="utf-8",
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        # отдельный логгер без propagate: спаны не попадают в обычный лог
+        out = logging.getLogger("bot.trace.spans")
+        out.handlers[:] = [handler]
+        out.setLevel(logging.INFO)
+        out.propagate = False
+        self._out = out
+        self.slow_sec = slow_ms / 1000
+        self.enabled = True
+        logger.info("Tracing spans slower than %.0f ms to %s", slow_ms, path)
+
+    def span(self, stage: str, **fields: Any) -> AbstractContextManager[Span]:
+        """
+        with span("steam_batch", batch=3) as sp: ...
+        Исключение внутри помечает спан ошибкой и летит дальше.
+        """
+        if not self.enabled:
+            return _NOOP_CM
+        return self._span(stage, fields)
+
+    @contextmanager
+    def _span(self, stage: str, fields: dict[str, Any]) -> Iterator[Span]:
+        sp = Span(stage, fields)
+        t0 = time.perf_counter()
+        try:
+            yield sp
+        except BaseException as e:
+            sp.fail(e, "cancelled" if not isinstance(e, Exception) else "error")
+            raise
+        finally:
+            self._finish(sp, time.perf_counter() - t0)
+
+    def record(self, stage: str, seconds: float, **fields: Any) -> None:
+        """
+        Спан, длительность которого посчитана снаружи (сумма по батчам и т.п.).
+        """
+        if self.enabled:
+            self._finish(Span(stage, fields), seconds)
+
+    def tick(self) -> AbstractContextManager[Span]:
+        """
+        Объемлющий спан тика: вложенные спаны (и задачи, созданные внутри)
+        получают его номер.
+        """
+        if not self.enabled:
+            return _NOOP_CM
+        return self._tick()
+
+    @contextmanager
+    def _tick(self) -> Iterator[Span]:
+        token = _tick_id.set(next(_ticks))
+        try:
+            with self.span("tick") as sp:
+                yield sp
+        finally:
+            _tick_id.reset(token)
+
+    def _finish(self, sp: Span, seconds: float) -> None:
+        if seconds < self.slow_sec and sp.outcome == "ok":
+            return
+        row = {
+            "ts": round(time.time(), 3),
+            "tick": _tick_id.get(),
+            "stage": sp.stage,
+            "ms": round(seconds * 1000, 1),
+            "outcome": sp.outcome,
+            **sp.fields,
+        }
+        if sp.error:
+            row["error"] = sp.error
+        try:
+            self._out.info(json.dumps(row, ensure_ascii=False, default=str))
+        except Exception:
+            logger.exception("Failed to write trace span")
+
+
+TRACER = Tracer()
+configure = TRACER.configure
+span = TRACER.span
+record = TRACER.record
+tick = TRACER.tick
@@ -0,0 +1,70 @@
+import logging
+from typing import Any, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+from aiohttp import web
+
+from bot import metrics
+from bot.events import EVENTS_BUS, EVENTS_TOKEN, EventBus, events_handler
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(
+        body=metrics.render().encode("utf-8"),
+        headers={"Content-Type": PROMETHEUS_CONTENT_TYPE},
+    )
+
+
+def build_app(events: Optional[EventBus] = None, events_token: str = "") -> web.Application:
+    """
+    Общий HTTP-сервер бота: /metrics, /events (SSE-лента переходов,
+    если передана шина) и другие служебные эндпоинты.
+    Живёт в том же event loop, что и бот с поллером.
+    """
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    if events is not None:
+        app[EVENTS_BUS] = events
+        app[EVENTS_TOKEN] = events_token
+        app.router.add_get("/events", events_handler)
+    return app
+
+
+def add_webhook(
+    app: web.Application,
+    dp: Dispatcher,
+    bot: Bot,
+    path: str,
+    secret: str,
+    **data: Any,
+) -> SimpleRequestHandler:
+    """
+    Вешает приём апдейтов Telegram на общий app.
+
+    Запросы без верного X-Telegram-Bot-Api-Secret-Token получают 401.
+    Апдейт обрабатывается в фоне: Telegram сразу получает 200 и не
+    держит соединение, пока хендлер ходит в БД/Bot API.
+    data — то же, что kwargs у start_polling (store, panels, ...).
+    """
+    handler = SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=secret,
+        **data,
+    )
+    handler.register(app, path=path)
+    return handler
+
+
+async def start_web(app: web.Application, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("HTTP server listening on %s:%d", host, port)
+    return runner
@@ -0,0 +1,158 @@
+"""
+Воркер-поллер для POLLER_MODE=external.
+
+    python -m bot.worker
+
+Сколько угодно воркеров (процессов или контейнеров) делят steam_id
+по шардам через таблицу shard_leases, опрашивают Steam только по своим
+шардам и складывают изменения присутствия в presence_updates.
+Алерты и панели остаются за единственным процессом бота (bot.main).
+"""
+import asyncio
+import logging
+import signal
+import time
+from typing import Optional
+
+from bot.config import Config, load_config
+from bot.db import session_scope
+from bot.migrate import init_models
+from bot.poller import SteamSource
+from bot.quota import SteamUnavailable
+from bot.repo import append_presence_updates, list_steam_ids, list_watched_appids
+from bot.shards import LeaseManager
+from bot.steam import SteamClient
+
+logger = logging.getLogger(__name__)
+
+
+class Worker:
+    def __init__(self, cfg: Config, steam: SteamClient, leases: LeaseManager) -> None:
+        self.cfg = cfg
+        self.source = SteamSource(cfg, steam)
+        self.leases = leases
+
+        # последнее отправленное боту (gameid, personaname) — шлём только изменения
+        self._last: dict[int, tuple[Optional[str], Optional[str]]] = {}
+        self._shards: set[int] = set()
+        self._lease_ts = 0.0
+        self._roster_ts = 0.0
+
+    async def refresh(self) -> None:
+        """
+        Продлевает аренды и, если набор шардов поменялся или пора,
+        перечитывает свои steam_id.
+        """
+        now = time.monotonic()
+        if now - self._lease_ts < self.cfg.lease_ttl / 3:
+            return
+        self._lease_ts = now
+
+        shards = set(await self.leases.rebalance())
+        if shards == self._shards and now - self._roster_ts < self.cfg.poll_interval:
+            return
+        self._shards = shards
+        self._roster_ts = now
+
+        async with session_scope() as session:
+            steam_ids = await list_steam_ids(session)
+            appids = await list_watched_appids(session, self.cfg.bf6_appid)
+            await session.commit()
+
+        mine = [sid for sid in steam_ids if self.leases.owns(sid)]
+        self.source.sync(mine, appids)
+
+        keep = set(mine)
+        self._last = {sid: v for sid, v in self._last.items() if sid in keep}
+
+    async def tick(self) -> int:
+        steam_ids, summaries = await self.source.poll()
+        now = int(time.time())
+
+        rows: list[dict] = []
+        sent: dict[int, tuple[Optional[str], Optional[str]]] = {}
+        for sid in steam_ids:
+            pdata = summaries.get(sid) or {}
+            gameid = pdata.get("gameid")
+            personaname = pdata.get("personaname")
+            key = (str(gameid) if gameid is not None else None, personaname)
+            if self._last.get(sid) == key:
+                continue
+            sent[sid] = key
+            rows.append(
+                {
+                    "steam_id": sid,
+                    "gameid": key[0],
+                    "personaname": personaname,
+                    "personastate": int(pdata.get("personastate") or 0),
+                    "lastlogoff": pdata.get("lastlogoff"),
+                    "observed_ts": now,
+                }
+            )
+
+        if rows:
+            async with session_scope() as session:
+                await append_presence_updates(session, rows)
+                await session.commit()
+        # запоминаем только записанное: после сбоя записи те же изменения
+        # придут со следующим опросом и уйдут снова
+        self._last.update(sent)
+        self.source.commit(steam_ids, summaries)
+        return len(rows)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+                await self.tick()
+            except SteamUnavailable as e:
+                logger.warning("Worker polling skipped: %s", e)
+            except Exception:
+                logger.exception("Worker polling error")
+
+            sleep = min(self.source.seconds_until_due(), self.cfg.lease_ttl / 3)
+            await asyncio.sleep(sleep)
+
+
+async def main() -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+    cfg = load_config(require_bot_token=False)
+    if not cfg.steam_api_key:
+        raise RuntimeError("STEAM_API_KEY is not set")
+
+    await init_models()
+
+    # квоты ключей считаются в каждом процессе отдельно: при N воркерах
+    # задайте STEAM_DAILY_LIMIT как долю лимита ключа на один воркер
+    steam = SteamClient(
+        cfg.steam_api_key,
+        concurrency=cfg.steam_concurrency,
+        rate_per_sec=cfg.steam_rps,
+        base_url=cfg.steam_api_base,
+        daily_limit=cfg.steam_daily_limit,
+        retries=cfg.steam_retries,
+        breaker_threshold=cfg.steam_breaker_threshold,
+        breaker_reset=cfg.steam_breaker_reset,
+    )
+    leases = LeaseManager(cfg.worker_id, cfg.poll_shards, cfg.lease_ttl)
+
+    # docker stop шлёт SIGTERM — выходим через finally и отпускаем аренды
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+
+    logger.info("Poller worker %s starting...", cfg.worker_id)
+    try:
+        await Worker(cfg, steam, leases).run()
+    except asyncio.CancelledError:
+        logger.info("Poller worker %s stopping...", cfg.worker_id)
+    finally:
+        await steam.close()
+        # отпускаем шарды сразу, не дожидаясь истечения аренды
+        await leases.release_all()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())